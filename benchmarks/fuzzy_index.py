@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of titleindex.FuzzyIndex.
+
+Usage: python benchmarks/fuzzy_index.py [num_titles]
+
+Builds an index of synthetic titles of one to three random words and
+reports build time, growth of peak memory and time to suggest titles for
+queries with a character dropped. Exits with status 1 if suggestions take
+`target_ms` or more per query.
+"""
+import os
+import sys
+import gc
+import time
+import random
+import resource
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path[0:0] = [root, os.path.join(root, 'lib')]
+
+import titleindex
+
+
+target_ms = 0.5
+
+
+def make_titles(n, rand):
+    def word():
+        return u''.join(rand.choice(u'abcdefghijklmnopqrstuvwxyz') for _ in range(rand.randint(3, 9)))
+
+    titles = set()
+    while len(titles) < n:
+        titles.add(u' '.join(word() for _ in range(rand.randint(1, 3))).capitalize())
+    return list(titles)
+
+
+def main(num_titles=50000, num_queries=200, repeat=3):
+    rand = random.Random(0)
+    titles = make_titles(num_titles, rand)
+    normalize = lambda title: title.lower().replace(u' ', u'')
+
+    gc.collect()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.time()
+    index = titleindex.FuzzyIndex(titles, normalize)
+    elapsed = time.time() - started
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+    print 'build %d titles: %.2fs, +%.0fMB, %d deletes' % (num_titles, elapsed, rss / 1024.0,
+                                                           len(index.deletes))
+
+    queries = []
+    for title in rand.sample(titles, num_queries):
+        i = rand.randrange(len(title))
+        queries.append(title[:i] + title[i + 1:])
+    timings = []
+    for _ in range(repeat):
+        started = time.time()
+        found = sum(1 for q in queries if len(index.suggest(q)) > 0)
+        timings.append(time.time() - started)
+    per_query_ms = min(timings) * 1000 / num_queries
+    print 'suggest: %.3fms per query, %d/%d found' % (per_query_ms, found, num_queries)
+
+    met = per_query_ms < target_ms
+    print 'target %.1fms per query: %s' % (target_ms, 'met' if met else 'MISSED')
+    return met
+
+
+if __name__ == '__main__':
+    if not main(*[int(arg) for arg in sys.argv[1:]]):
+        sys.exit(1)
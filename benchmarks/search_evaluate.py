@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of related page search evaluation.
+
+Usage: python benchmarks/search_evaluate.py
+
+Evaluates synthetic expressions with 10 to 100 operands, each of which has
+a link scoretable of a few hundred titles, and compares search.evaluate()
+with the list based implementation it replaced.
+"""
+import os
+import sys
+import timeit
+import random
+import operator
+from collections import OrderedDict
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path[0:0] = [root, os.path.join(root, 'lib')]
+
+import search
+
+
+def legacy_evaluate(positives, negatives):
+    scoretable = {}
+    keys = positives.keys() + negatives.keys()
+    length = len(keys)
+    for scores in positives.values():
+        for title, score in scores.items():
+            if title in keys:
+                continue
+            if title not in scoretable:
+                scoretable[title] = 0.0
+            scoretable[title] += score / length
+    for scores in negatives.values():
+        for title, score in scores.items():
+            if title in keys:
+                continue
+            if title not in scoretable:
+                scoretable[title] = 0.0
+            scoretable[title] -= score / length
+    return OrderedDict(sorted(scoretable.iteritems(), key=operator.itemgetter(1), reverse=True))
+
+
+def make_expression(rand, num_titles, num_operands, table_size):
+    titles = [u'Page %d' % i for i in range(num_titles)]
+    operands = rand.sample(titles, num_operands)
+    scoretables = dict((title, dict((t, rand.random()) for t in rand.sample(titles, table_size)))
+                       for title in operands)
+    num_negatives = num_operands // 5
+    negatives = dict((t, scoretables.pop(t)) for t in operands[:num_negatives])
+    return scoretables, negatives
+
+
+def main(num_titles=20000, table_size=300, repeat=5):
+    rand = random.Random(0)
+    print '%8s %12s %12s %12s' % ('operands', 'legacy(ms)', 'full(ms)', 'top20(ms)')
+    for num_operands in [10, 20, 50, 100]:
+        positives, negatives = make_expression(rand, num_titles, num_operands, table_size)
+        assert legacy_evaluate(positives, negatives).keys()[:20] ==\
+            search.evaluate(positives, negatives, limit=20).keys()
+
+        timings = []
+        for fn in [lambda: legacy_evaluate(positives, negatives),
+                   lambda: search.evaluate(positives, negatives),
+                   lambda: search.evaluate(positives, negatives, limit=20)]:
+            timings.append(min(timeit.repeat(fn, number=1, repeat=repeat)) * 1000)
+        print '%8d %12.2f %12.2f %12.2f' % tuple([num_operands] + timings)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of wikiquery parsing.
+
+Usage: python benchmarks/wikiquery_parse.py
+
+Parses a set of typical wikiqueries repeatedly, as pages embedding them are
+rendered, and compares the pyparsing grammar search.py used to have with
+the hand-written parser, both uncached and through the LRU cache of
+search.parse_wikiquery(). Also reports time to import pyparsing, which every
+cold start used to pay.
+"""
+import os
+import sys
+import time
+import timeit
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path[0:0] = [root, os.path.join(root, 'lib')]
+
+import search
+
+started = time.time()
+import pyparsing as p
+pyparsing_import_ms = (time.time() - started) * 1000
+
+
+identifier = p.Regex(r'([a-zA-Z_][.0-9a-zA-Z_]*)')
+double_quote_str = p.dblQuotedString.setParseAction(p.removeQuotes)
+
+page_query_expr = p.Forward()
+attr_expr = p.Forward()
+
+expr = page_query_expr + p.Optional(p.Suppress('>') + attr_expr)
+expr.setParseAction(lambda x: x if len(x) == 2 else [x[0], ['name']])
+
+page_query_term = p.Group(p.Optional(identifier + p.Suppress(':')) + double_quote_str)
+page_query_term.setParseAction(lambda x: x if len(x[0]) == 2 else [['name', x[0][0]]])
+page_query_expr << p.operatorPrecedence(page_query_term, [
+    (p.Literal('*'), 2, p.opAssoc.LEFT),
+    (p.Literal('+'), 2, p.opAssoc.LEFT),
+])
+
+attr_expr << p.Group(p.delimitedList(identifier))
+
+
+queries = [
+    u'"Hello"',
+    u'"Hello" > name, author',
+    u'schema:"Book"',
+    u'schema:"Book" * author:"Alan Moore"',
+    u'schema:"Book" * (author:"Alan Moore" + author:"Neil Gaiman") > name, datePublished',
+    u'(schema:"Person" + schema:"Organization") * "Seoul" > name, address, url',
+]
+
+
+def main(repeat=5, number=1000):
+    print 'import pyparsing: %.1fms' % pyparsing_import_ms
+    print '%-60s %12s %12s %12s' % ('query', 'pyparsing(us)', 'parser(us)', 'cached(us)')
+    for q in queries:
+        assert expr.parseString(q, parseAll=True).asList() == search.parse_wikiquery(q)
+
+        timings = []
+        for fn in [lambda: expr.parseString(q, parseAll=True).asList(),
+                   lambda: search._WikiqueryParser(q).query(),
+                   lambda: search.parse_wikiquery(q)]:
+            timings.append(min(timeit.repeat(fn, number=number, repeat=repeat)) * 1e6 / number)
+        print '%-60s %12.1f %12.1f %12.1f' % tuple([q[:60]] + timings)
+
+
+if __name__ == '__main__':
+    main()
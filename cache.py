@@ -1,10 +1,16 @@
 from google.appengine.api import memcache
 import threading
+import random
 
 
 prc = None
 max_recent_users = 20
 
+# Instance-wide cache. Unlike prc, it survives between requests on the same
+# instance. Each entry is tagged with a generation number kept in memcache so
+# that changes made on other instances invalidate it.
+_instance_cache = {}
+
 
 class PerRequestCache(threading.local):
     def get(self, key):
@@ -29,6 +35,86 @@ if prc is None:
     create_prc()
 
 
+def get_generation(name):
+    key = 'generation\t%s' % name
+    if prc.get(key) is None:
+        try:
+            value = memcache.get(key)
+            if value is None:
+                # start from random number so that evicted generation does not
+                # revive stale instance cache
+                memcache.add(key, random.randint(1, 2 ** 30))
+                value = memcache.get(key)
+            prc.set(key, value)
+        except:
+            pass
+    return prc.get(key)
+
+
+def incr_generation(name):
+    key = 'generation\t%s' % name
+    try:
+        prc.set(key, memcache.incr(key, initial_value=random.randint(1, 2 ** 30)))
+    except:
+        return None
+
+
+def incr_generations(names):
+    try:
+        values = memcache.offset_multi(dict((name, 1) for name in names), key_prefix='generation\t',
+                                       initial_value=random.randint(1, 2 ** 30))
+        for name, value in values.items():
+            prc.set('generation\t%s' % name, value)
+    except:
+        return None
+
+
+def get_generations(names):
+    """Returns dict of name -> generation, fetching missing ones at once"""
+    result = {}
+    missing = []
+    for name in names:
+        value = prc.get('generation\t%s' % name)
+        if value is None:
+            missing.append(name)
+        else:
+            result[name] = value
+
+    if len(missing) > 0:
+        try:
+            values = memcache.get_multi(missing, key_prefix='generation\t')
+            new_values = dict((name, random.randint(1, 2 ** 30))
+                              for name in missing if name not in values)
+            if len(new_values) > 0:
+                memcache.add_multi(new_values, key_prefix='generation\t')
+                values.update(memcache.get_multi(new_values.keys(), key_prefix='generation\t'))
+            for name, value in values.items():
+                prc.set('generation\t%s' % name, value)
+                result[name] = value
+        except:
+            pass
+    return result
+
+
+def get_instance(name, generation_name=None):
+    generation = get_generation(generation_name or name)
+    entry = _instance_cache.get(name)
+    if generation is None or entry is None or entry[0] != generation:
+        return None
+    return entry[1]
+
+
+def set_instance(name, value, generation_name=None):
+    generation = get_generation(generation_name or name)
+    if generation is not None:
+        _instance_cache[name] = (generation, value)
+
+
+def get_instance_entry(name):
+    """Returns (generation, value) kept in instance memory, however old"""
+    return _instance_cache.get(name, (None, None))
+
+
 def add_recent_email(email):
     key = 'view\trecentemails'
     try:
@@ -73,6 +159,14 @@ def get_recent_emails():
     return prc.get(key)
 
 
+def incr_view_count(title):
+    key = 'view\tcount\t%s' % title
+    try:
+        return memcache.incr(key, initial_value=0)
+    except:
+        return None
+
+
 def set_titles(email, content):
     try:
         add_recent_email(email)
@@ -88,16 +182,37 @@ def get_titles(email):
         return None
 
 
-def del_titles():
+def del_titles(title=None, exists=True):
+    """Invalidates cached titles. Creation (or deletion if not exists) of
+    title is logged under the new generation of 'titles'."""
     try:
         emails = get_recent_emails()
         keys = ['model\ttitles\t%s' % email
                 for email in emails + ['None']]
         memcache.delete_multi(keys)
+        incr_generation('titles')
+        generation = prc.get('generation\ttitles')
+        if title is not None and generation is not None:
+            memcache.set('model\ttitle_change\t%d' % generation, (title, exists))
     except:
         return None
 
 
+def get_title_changes(since, until, max_changes=1000):
+    """Returns list of (title, exists) logged by del_titles() for generations
+    in (since, until], or None if any of them is missing."""
+    if since is None or until is None or not 0 <= until - since <= max_changes:
+        return None
+    keys = ['model\ttitle_change\t%d' % generation for generation in range(since + 1, until + 1)]
+    try:
+        changes = memcache.get_multi(keys)
+    except:
+        return None
+    if len(changes) != len(keys):
+        return None
+    return [changes[key] for key in keys]
+
+
 def set_config(value):
     key = 'model\tconfig'
     try:
@@ -107,6 +222,52 @@ def set_config(value):
         return None
 
 
+def set_redirects(value):
+    key = 'model\tredirects'
+    try:
+        memcache.set(key, value)
+        prc.set(key, value)
+    except:
+        return None
+
+
+def set_title_filter(value):
+    key = 'model\ttitle_filter'
+    try:
+        memcache.set(key, value)
+        prc.set(key, value)
+        incr_generation('title_filter')
+    except:
+        return None
+
+
+def update_title_filter(update, retries=5):
+    """Applies update() to cached title filter with compare-and-set.
+
+    update() modifies given filter in place and returns False if the filter
+    should be dropped instead. Returns True if the filter has been updated,
+    otherwise the filter is dropped (to be rebuilt on next use) or has not
+    been cached at all.
+    """
+    key = 'model\ttitle_filter'
+    try:
+        client = memcache.Client()
+        for _ in range(retries):
+            value = client.gets(key)
+            if value is None:
+                return False
+            if not update(value):
+                break
+            if client.cas(key, value):
+                prc.set(key, value)
+                incr_generation('title_filter')
+                return True
+        del_title_filter()
+        return False
+    except:
+        return False
+
+
 def set_rendered_body(title, value):
     key = 'model\trendered_body\t%s' % title
     try:
@@ -116,6 +277,31 @@ def set_rendered_body(title, value):
         return None
 
 
+def set_link_scoretable(title, value):
+    key = 'model\tlink_scoretable\t%s' % title
+    try:
+        memcache.set(key, value)
+        prc.set(key, value)
+    except:
+        return None
+
+
+def set_search_result(expression, generations, value):
+    key = 'search\tresult\t%s' % expression
+    try:
+        memcache.set(key, (generations, value), time=60 * 60 * 24)
+    except:
+        return None
+
+
+def set_text_search(terms, generations, value):
+    key = u'search\ttext\t%s' % u' '.join(terms)
+    try:
+        memcache.set(key, (generations, value), time=60 * 60)
+    except:
+        return None
+
+
 def set_wikiquery(q, email, value):
     key = 'model\twikiquery\t%s\t%s' % (q, email)
 
@@ -175,6 +361,26 @@ def get_config():
     return prc.get(key)
 
 
+def get_redirects():
+    key = 'model\tredirects'
+    if prc.get(key) is None:
+        try:
+            prc.set(key, memcache.get(key))
+        except:
+            pass
+    return prc.get(key)
+
+
+def get_title_filter():
+    key = 'model\ttitle_filter'
+    if prc.get(key) is None:
+        try:
+            prc.set(key, memcache.get(key))
+        except:
+            pass
+    return prc.get(key)
+
+
 def get_rendered_body(title):
     key = 'model\trendered_body\t%s' % title
     if prc.get(key) is None:
@@ -185,6 +391,40 @@ def get_rendered_body(title):
     return prc.get(key)
 
 
+def get_link_scoretable(title):
+    key = 'model\tlink_scoretable\t%s' % title
+    if prc.get(key) is None:
+        try:
+            prc.set(key, memcache.get(key))
+        except:
+            pass
+    return prc.get(key)
+
+
+def get_search_result(expression, generations):
+    """Returns cached result if generations of its operands are unchanged"""
+    key = 'search\tresult\t%s' % expression
+    try:
+        entry = memcache.get(key)
+    except:
+        return None
+    if entry is None or entry[0] != generations:
+        return None
+    return entry[1]
+
+
+def get_text_search(terms, generations):
+    """Returns cached result if generations of its terms are unchanged"""
+    key = u'search\ttext\t%s' % u' '.join(terms)
+    try:
+        entry = memcache.get(key)
+    except:
+        return None
+    if entry is None or entry[0] != generations:
+        return None
+    return entry[1]
+
+
 def get_wikiquery(q, email):
     key = 'model\twikiquery\t%s\t%s' % (q, email)
     if prc.get(key) is None:
@@ -234,6 +474,36 @@ def del_config():
         return None
 
 
+def del_redirects():
+    key = 'model\tredirects'
+    try:
+        memcache.delete(key)
+        prc.set(key, None)
+        incr_generation('redirects')
+    except:
+        return None
+
+
+def del_title_filter():
+    key = 'model\ttitle_filter'
+    try:
+        memcache.delete(key)
+        prc.set(key, None)
+        incr_generation('title_filter')
+    except:
+        return None
+
+
+def del_link_scoretable(title):
+    key = 'model\tlink_scoretable\t%s' % title
+    try:
+        memcache.delete(key)
+        prc.set(key, None)
+        incr_generation('link_scoretable\t%s' % title)
+    except:
+        return None
+
+
 def del_rendered_body(title):
     key = 'model\trendered_body\t%s' % title
     try:
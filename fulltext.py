@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import re
+import math
+
+
+# hangul syllables are split into bigrams, other words are kept as is
+re_token = re.compile(ur'[가-힣]+|[^\W_가-힣]+', re.UNICODE)
+max_term_length = 100
+
+
+def is_hangul(word):
+    return u'가' <= word[0] <= u'힣'
+
+
+def tokenize(text):
+    """Returns list of (term, start, end) of text"""
+    tokens = []
+    for m in re_token.finditer(text.lower()):
+        word, start = m.group(0), m.start()
+        if is_hangul(word) and len(word) > 1:
+            for i in range(len(word) - 1):
+                tokens.append((word[i:i + 2], start + i, start + i + 2))
+        elif len(word) <= max_term_length:
+            tokens.append((word, start, m.end()))
+    return tokens
+
+
+def term_frequencies(text):
+    """Returns dict of term -> number of occurrences in text"""
+    tfs = {}
+    for term, _, _ in tokenize(text):
+        tfs[term] = tfs.get(term, 0) + 1
+    return tfs
+
+
+def bm25(tf, length, df, num_docs, avg_length, k1=1.2, b=0.75):
+    """Okapi BM25 score of a term in a document"""
+    idf = math.log(1.0 + (num_docs - df + 0.5) / (df + 0.5))
+    norm = k1 * (1.0 - b + b * length / max(avg_length, 1.0))
+    return idf * tf * (k1 + 1.0) / (tf + norm)
+
+
+def snippet(text, terms, width=160):
+    """Returns (snippet, highlights) of text around first match of terms.
+
+    highlights is a list of (start, end) offsets of matched terms in snippet.
+    """
+    terms = set(terms)
+    matches = [(s, e) for t, s, e in tokenize(text) if t in terms]
+    start = max(matches[0][0] - width // 4, 0) if matches else 0
+    end = min(start + width, len(text))
+
+    highlights = []
+    for s, e in matches:
+        if s < start or e > end:
+            continue
+        s, e = s - start, e - start
+        if highlights and s <= highlights[-1][1]:
+            # overlapping bigrams
+            highlights[-1] = (highlights[-1][0], max(highlights[-1][1], e))
+        else:
+            highlights.append((s, e))
+    return text[start:end], highlights
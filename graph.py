@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+import json
+import math
+import zlib
+import heapq
+import struct
+import operator
+from array import array
+from collections import deque
+
+
+class LinkGraph(object):
+    """Read-only link graph in compressed sparse row (CSR) form.
+
+    Nodes are numbered by title order. Outgoing links of node `i` are
+    `targets[offsets[i]:offsets[i + 1]]` and rel of each link is stored at
+    the same position of `rels` as an index of `rel_names`.
+    """
+    def __init__(self, titles, rel_names, offsets, targets, rels):
+        self.titles = titles
+        self.ids = dict((title, i) for i, title in enumerate(titles))
+        self.rel_names = rel_names
+        self.offsets = offsets
+        self.targets = targets
+        self.rels = rels
+        self._transposed = None
+
+    @classmethod
+    def from_links(cls, links):
+        """Builds graph from dict of {source: {rel: [target, ...]}}"""
+        titles = set(links.keys())
+        rel_names = set()
+        for outlinks in links.values():
+            for rel, targets in outlinks.items():
+                rel_names.add(rel)
+                titles.update(targets)
+        titles = sorted(titles)
+        rel_names = sorted(rel_names)
+
+        ids = dict((title, i) for i, title in enumerate(titles))
+        rel_ids = dict((rel, i) for i, rel in enumerate(rel_names))
+
+        offsets = array('i', [0])
+        targets = array('i')
+        rels = array('H')
+        for title in titles:
+            edges = set()
+            for rel, ts in links.get(title, {}).items():
+                for t in ts:
+                    edges.add((ids[t], rel_ids[rel]))
+            for target, rel in sorted(edges):
+                targets.append(target)
+                rels.append(rel)
+            offsets.append(len(targets))
+
+        return cls(titles, rel_names, offsets, targets, rels)
+
+    def __len__(self):
+        return len(self.titles)
+
+    @property
+    def num_links(self):
+        return len(self.targets)
+
+    def outlinks(self, node):
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def outdegree(self, node):
+        return self.offsets[node + 1] - self.offsets[node]
+
+    def transpose(self):
+        """Returns graph with every link reversed (i.e. inlinks)"""
+        n = len(self.titles)
+        counts = [0] * (n + 1)
+        for target in self.targets:
+            counts[target + 1] += 1
+        for i in range(n):
+            counts[i + 1] += counts[i]
+
+        offsets = array('i', counts)
+        targets = array('i', [0] * len(self.targets))
+        rels = array('H', [0] * len(self.rels))
+        pos = counts[:]
+        for source in range(n):
+            for i in range(self.offsets[source], self.offsets[source + 1]):
+                target = self.targets[i]
+                targets[pos[target]] = source
+                rels[pos[target]] = self.rels[i]
+                pos[target] += 1
+
+        return LinkGraph(self.titles, self.rel_names, offsets, targets, rels)
+
+    def transposed(self):
+        """Same as transpose() but built only once per graph"""
+        if self._transposed is None:
+            self._transposed = self.transpose()
+        return self._transposed
+
+    def dumps(self):
+        """Serializes graph into compressed binary string"""
+        header = json.dumps({'titles': self.titles, 'rel_names': self.rel_names})
+        parts = [
+            struct.pack('<III', len(header), len(self.offsets), len(self.targets)),
+            header,
+            self.offsets.tostring(),
+            self.targets.tostring(),
+            self.rels.tostring(),
+        ]
+        return zlib.compress(''.join(parts))
+
+    @classmethod
+    def loads(cls, blob):
+        data = zlib.decompress(blob)
+        header_len, offsets_len, targets_len = struct.unpack_from('<III', data)
+        pos = struct.calcsize('<III')
+        header = json.loads(data[pos:pos + header_len])
+        pos += header_len
+
+        offsets = array('i')
+        targets = array('i')
+        rels = array('H')
+        for arr, length in [(offsets, offsets_len), (targets, targets_len), (rels, targets_len)]:
+            size = arr.itemsize * length
+            arr.fromstring(data[pos:pos + size])
+            pos += size
+
+        return cls(header['titles'], header['rel_names'], offsets, targets, rels)
+
+
+def personalized_pagerank(link_graph, source, alpha=0.15, max_iterations=30, epsilon=1e-6):
+    """Returns dict of node -> score of random walk with restart from source.
+
+    Walker follows outlinks and jumps back to source with probability
+    `alpha` (or when it reaches a page without outlinks). The series
+    sum(alpha * (1 - alpha)^t * P^t) is evaluated with sparse vectors, and
+    entries smaller than `epsilon` are dropped to keep them sparse.
+    """
+    offsets = link_graph.offsets
+    targets = link_graph.targets
+    scores = {}
+    walkers = {source: 1.0}
+
+    for _ in range(max_iterations):
+        next_walkers = {}
+        for node, mass in walkers.iteritems():
+            scores[node] = scores.get(node, 0.0) + alpha * mass
+
+            start, end = offsets[node], offsets[node + 1]
+            rest = (1.0 - alpha) * mass
+            if start == end:
+                next_walkers[source] = next_walkers.get(source, 0.0) + rest
+                continue
+
+            share = rest / (end - start)
+            for i in xrange(start, end):
+                target = targets[i]
+                next_walkers[target] = next_walkers.get(target, 0.0) + share
+
+        walkers = dict((node, mass) for node, mass in next_walkers.iteritems()
+                       if mass >= epsilon)
+        if len(walkers) == 0:
+            break
+
+    return scores
+
+
+def related_nodes(link_graph, source, limit=30, **kwargs):
+    """Returns list of (node, score) most related to source, excluding itself"""
+    scores = personalized_pagerank(link_graph, source, **kwargs)
+    scores.pop(source, None)
+    return heapq.nlargest(limit, scores.iteritems(), key=operator.itemgetter(1))
+
+
+def local_push(outlinks_of, source, alpha=0.15, epsilon=1e-3, max_pushes=1000):
+    """Approximates personalized PageRank from source by forward push.
+
+    Unlike personalized_pagerank(), works on any graph given as a function
+    from node to list of its outlinks and only touches nodes near source:
+    residual of a node is pushed to its neighbors only when it is larger than
+    `epsilon` times its outdegree, so the total work is bounded by
+    O(1 / (alpha * epsilon)) regardless of graph size. Returns dict of
+    node -> score.
+    """
+    neighbors = {}
+
+    def get_neighbors(node):
+        if node not in neighbors:
+            neighbors[node] = outlinks_of(node)
+        return neighbors[node]
+
+    scores = {}
+    residuals = {source: 1.0}
+    queue = deque([source])
+    pushes = 0
+
+    while queue and pushes < max_pushes:
+        node = queue.popleft()
+        residual = residuals.get(node, 0.0)
+        links = get_neighbors(node)
+        if residual < epsilon * max(len(links), 1):
+            continue
+
+        pushes += 1
+        scores[node] = scores.get(node, 0.0) + alpha * residual
+        residuals[node] = 0.0
+
+        # page without outlinks returns walker to source
+        targets = links if len(links) > 0 else [source]
+        share = (1.0 - alpha) * residual / len(targets)
+        for target in targets:
+            residuals[target] = residuals.get(target, 0.0) + share
+            if residuals[target] >= epsilon * max(len(get_neighbors(target)), 1):
+                queue.append(target)
+
+    return scores
+
+
+def _shared_neighbor_scores(forward, backward, source, max_degree):
+    """Returns dict of node -> cosine similarity of forward neighbor sets.
+
+    Nodes sharing a neighbor with source are found by walking one step
+    forward and one step backward. Neighbors having more than `max_degree`
+    backward links are skipped as they carry little information.
+    """
+    neighbors = set(forward.outlinks(source))
+    counts = {}
+    for middle in neighbors:
+        others = set(backward.outlinks(middle))
+        if len(others) > max_degree:
+            continue
+        for other in others:
+            counts[other] = counts.get(other, 0) + 1
+    counts.pop(source, None)
+
+    return dict((node, count / math.sqrt(len(neighbors) * len(set(forward.outlinks(node)))))
+                for node, count in counts.iteritems())
+
+
+def link_similarity(link_graph, source, mode='both', limit=30, max_degree=1000):
+    """Returns list of (node, score) most similar to source by shared links.
+
+    Modes are `cocitation` (pages linking to both), `coupling` (pages both
+    link to) or `both` (mean of the two). Scores are cosine similarities in
+    [0, 1] and ties are broken by node order, so the result is deterministic.
+    """
+    inlink_graph = link_graph.transposed()
+    if mode == 'cocitation':
+        scores = _shared_neighbor_scores(inlink_graph, link_graph, source, max_degree)
+    elif mode == 'coupling':
+        scores = _shared_neighbor_scores(link_graph, inlink_graph, source, max_degree)
+    elif mode == 'both':
+        scores = _shared_neighbor_scores(inlink_graph, link_graph, source, max_degree)
+        coupling = _shared_neighbor_scores(link_graph, inlink_graph, source, max_degree)
+        for node, score in coupling.iteritems():
+            scores[node] = scores.get(node, 0.0) + score
+        for node in scores.keys():
+            scores[node] /= 2.0
+    else:
+        raise ValueError('Unknown mode: %s' % mode)
+
+    return heapq.nlargest(limit, scores.iteritems(), key=lambda (node, score): (score, -node))
@@ -37,6 +37,7 @@ DEFAULT_CONFIG = {
             'read': ['all'],
             'write': ['login'],
         },
+        'related_links_scorer': 'pagerank',
     },
     'highlight': {
         'style': 'default',
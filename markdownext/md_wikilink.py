@@ -15,36 +15,45 @@ RE_WIKILINK = ur'\[\[' \
 
 
 class WikiLinkExtension(Extension):
-    def __init__(self):
+    def __init__(self, title_exists=None):
         super(WikiLinkExtension, self).__init__()
         self.md = None
+        self.title_exists = title_exists
 
     def extendMarkdown(self, md, md_globals):
         self.md = md
-        wikilink_pattern = WikiLinks(RE_WIKILINK)
+        wikilink_pattern = WikiLinks(RE_WIKILINK, self.title_exists)
         wikilink_pattern.md = md
         md.inlinePatterns.add('wikilink', wikilink_pattern, "<link")
 
 
 class WikiLinks(Pattern):
-    def __init__(self, pattern):
+    def __init__(self, pattern, title_exists=None):
         super(WikiLinks, self).__init__(pattern)
         self.config = []
+        self.title_exists = title_exists
 
     def handleMatch(self, m):
-        return _render_match(m)
+        return _render_match(m, self.title_exists)
 
 
-def render_wikilink(linktext):
+def render_wikilink(linktext, title_exists=None):
     m = re.match(RE_WIKILINK, u'[[%s]]' % linktext)
-    return etree.tostring(_render_match(m))
+    return etree.tostring(_render_match(m, title_exists))
 
 
 def _build_url(label):
     return '/%s' % urllib2.quote(label.replace(' ', '_').encode('utf-8'))
 
 
-def _render_match(m):
+def _page_class(title, title_exists):
+    if title_exists is None or title_exists(title):
+        return 'wikipage'
+    else:
+        return 'wikipage missing'
+
+
+def _render_match(m, title_exists=None):
     if m.group('plain'):
         text = plain_link(m)
         if text[0] == '=':
@@ -59,7 +68,7 @@ def _render_match(m):
             a = etree.Element('a')
             a.text = text
             a.set('href', url)
-            a.set('class', 'wikipage')
+            a.set('class', _page_class(text, title_exists))
 
             if m.group('rel'):
                 a.set('itemprop', m.group('rel'))
@@ -73,7 +82,7 @@ def _render_match(m):
         year_a = etree.SubElement(a, 'a')
         year_a.text = year[0]
         year_a.set('href', _build_url(year[1]))
-        year_a.set('class', 'wikipage')
+        year_a.set('class', _page_class(year[1], title_exists))
 
         hyphen = etree.SubElement(a, 'span')
         hyphen.text = '-'
@@ -84,7 +93,7 @@ def _render_match(m):
             rest_a = etree.SubElement(a, 'a')
             rest_a.text = date[0]
             rest_a.set('href', _build_url(date[1]))
-            rest_a.set('class', 'wikipage')
+            rest_a.set('class', _page_class(date[1], title_exists))
         else:
             unknown_date = etree.SubElement(a, 'span')
             unknown_date.text = '??-??'
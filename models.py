@@ -1,16 +1,24 @@
 # -*- coding: utf-8 -*-
 import re
+import zlib
 import yaml
 import main
 import cache
+import graph
 import random
+import struct
 import schema
 import search
+import heapq
 import hashlib
 import logging
+import fulltext
+import titleindex
 import urllib2
+import unicodedata
 import markdown
 import operator
+import threading
 from bzrlib.merge3 import Merge3
 from lxml.html.clean import Cleaner
 from collections import OrderedDict
@@ -19,6 +27,7 @@ from google.appengine.api import users
 from google.appengine.api import oauth
 from datetime import datetime, timedelta
 from google.appengine.ext import deferred
+from google.appengine.datastore.datastore_query import Cursor
 from markdown.extensions.def_list import DefListExtension
 from markdown.extensions.attr_list import AttrListExtension
 from markdownext import md_url, md_wikilink, md_itemprop, md_mathjax, md_strikethrough
@@ -26,6 +35,9 @@ from markdownext import md_url, md_wikilink, md_itemprop, md_mathjax, md_striket
 
 logging.getLogger().setLevel(logging.DEBUG)
 
+# guards title indexes shared by concurrent requests in instance memory
+_title_index_lock = threading.Lock()
+
 
 class PageOperationMixin(object):
     re_img = re.compile(ur'<p><img( .+? )/></p>')
@@ -38,6 +50,7 @@ class PageOperationMixin(object):
                                          ur'April|May|June|July|August|'
                                          ur'September|October|November|'
                                          ur'December)( (?P<date>[0123]?\d))?)$')
+    max_inlinks_per_rel = 50
 
     @property
     def rendered_data(self):
@@ -69,7 +82,7 @@ class PageOperationMixin(object):
 
     def _render_data_item(self, name, value):
         if self._is_schema_item_link(name):
-            return u'<span itemprop="%s">%s</span>' % (name, md_wikilink.render_wikilink(value))
+            return u'<span itemprop="%s">%s</span>' % (name, md_wikilink.render_wikilink(value, WikiPage.title_exists))
         else:
             return u'<span itemprop="%s">%s</span>' % (name, value)
 
@@ -81,8 +94,8 @@ class PageOperationMixin(object):
         # incoming links
         if len(self.inlinks) > 0:
             lines = [u'# Incoming Links']
-            for rel, links in self.inlinks.items():
-                itemtype, rel = rel.split('/')
+            for full_rel, links in self.inlinks.items():
+                itemtype, rel = full_rel.split('/')
                 humane_rel = schema.humane_property(itemtype, rel, True)
                 lines.append(u'## %s' % humane_rel)
 
@@ -90,7 +103,12 @@ class PageOperationMixin(object):
                 links = list(set(links))
                 links.sort()
 
-                lines += [u'* [[%s]]' % title for title in links]
+                # show only first few links for hub pages
+                limit = self.max_inlinks_per_rel
+                lines += [u'* [[%s]]' % title for title in links[:limit]]
+                if len(links) > limit:
+                    url = u'%s?view=inlinks&rel=%s' % (self.absolute_url, urllib2.quote(full_rel.encode('utf-8')))
+                    lines.append(u'* [See all %d pages](%s)\n{.more}' % (len(links), url))
             body_parts.append(u'\n'.join(lines))
 
         # related links
@@ -467,6 +485,10 @@ class WikiPage(ndb.Model, PageOperationMixin):
     re_normalize_title = re.compile(ur'([\[\]\(\)\~\!\@\#\$\%\^\&\*\-'
                                     ur'\=\+\\:\;\'\"\,\.\/\?\<\>\s]|'
                                     ur'\bthe\b|\ban?\b)')
+    max_title_filter_changes = 1000
+    related_links_max_interval = timedelta(days=30)
+    views_per_related_links_churn = 100
+    text_search_max_hits = 200
 
     itemtype_path = ndb.StringProperty()
     title = ndb.StringProperty()
@@ -480,6 +502,10 @@ class WikiPage(ndb.Model, PageOperationMixin):
     inlinks = ndb.JsonProperty()
     outlinks = ndb.JsonProperty()
     related_links = ndb.JsonProperty()
+    # derived from metadata so that re-putting pages saved before it existed
+    # fills it in
+    redirect = ndb.ComputedProperty(
+        lambda self: PageOperationMixin.parse_metadata(self.body or u'').get('redirect'))
     updated_at = ndb.DateTimeProperty()
 
     published_at = ndb.DateTimeProperty()
@@ -487,10 +513,60 @@ class WikiPage(ndb.Model, PageOperationMixin):
     older_title = ndb.StringProperty()
     newer_title = ndb.StringProperty()
 
+    # link counters. updated whenever in/out links are saved
+    inlink_count = ndb.ComputedProperty(lambda self: sum(self.inlink_counts.values()))
+    outlink_count = ndb.ComputedProperty(
+        lambda self: sum(len(set(titles)) for titles in (self.outlinks or {}).values()))
+
+    # case folded, NFC normalized title to find pages by variant spellings
+    folded_title = ndb.ComputedProperty(lambda self: WikiPage.fold_title(self.title))
+
+    # related links refresh schedule. pages are refreshed in order of due time,
+    # which gets closer as the page is edited, relinked or viewed
+    related_links_updated_at = ndb.DateTimeProperty()
+    related_links_churn = ndb.IntegerProperty(default=0)
+    related_links_due_at = ndb.ComputedProperty(lambda self: self._related_links_due_at())
+
+    # version of computed properties stored with the page. pages saved with
+    # an older version (or none at all) are re-put by sweep() so that they
+    # can be found by new indexes such as folded_title
+    computed_properties_version = 1
+    stored_properties_version = ndb.IntegerProperty(indexed=False)
+
+    def _pre_put_hook(self):
+        # link_scoretable is derived from in/out links and related links
+        cache.del_link_scoretable(self.title)
+        self.stored_properties_version = WikiPage.computed_properties_version
+
     @property
     def is_old_revision(self):
         return False
 
+    @property
+    def inlink_counts(self):
+        """Number of incoming links per rel"""
+        return dict((rel, len(set(titles))) for rel, titles in (self.inlinks or {}).items())
+
+    @property
+    def edit_count(self):
+        return self.revision
+
+    def _related_links_due_at(self):
+        if not self.revision:
+            # placeholders have nothing to refresh
+            return datetime(9999, 12, 31)
+        if self.related_links_updated_at is None:
+            return datetime(1970, 1, 1)
+        interval = WikiPage.related_links_max_interval / (1 + (self.related_links_churn or 0))
+        return self.related_links_updated_at + interval
+
+    def add_related_links_churn(self, amount=1):
+        self.related_links_churn = (self.related_links_churn or 0) + amount
+
+    def _set_related_links_updated(self):
+        self.related_links_updated_at = datetime.now()
+        self.related_links_churn = 0
+
     @property
     def rendered_body(self):
         value = cache.get_rendered_body(self.title)
@@ -542,7 +618,8 @@ class WikiPage(ndb.Model, PageOperationMixin):
         keys = [r.key for r in self.revisions]
         ndb.delete_multi(keys)
 
-        cache.del_titles()
+        cache.del_titles(self.title, False)
+        WikiPage._update_title_filter(self, False)
 
     def update_content(self, new_body, base_revision, comment='', user=None, force_update=False, dont_create_rev=False):
         if not force_update and self.body == new_body:
@@ -603,6 +680,7 @@ class WikiPage(ndb.Model, PageOperationMixin):
         self.comment = comment
         if not dont_create_rev:
             self.revision += 1
+        self.add_related_links_churn()
 
         if not force_update:
             self.updated_at = datetime.now()
@@ -646,31 +724,70 @@ class WikiPage(ndb.Model, PageOperationMixin):
         new_data = self.data
         deferred.defer(self.rebuild_data_index_deferred, old_data, new_data)
 
-        # update inlinks and outlinks
+        # deferred update full-text index
+        deferred.defer(WikiPage._update_text_index_deferred, self.title)
+
+        # update redirect map
         old_redir = old_md.get('redirect')
         new_redir = new_md.get('redirect')
+        if old_redir != new_redir:
+            cache.del_redirects()
+
+        # update inlinks and outlinks
+        old_outlinks = self.outlinks
         self.update_links(old_redir, new_redir)
 
+        # refresh related links around this page
+        if self.outlinks != old_outlinks:
+            deferred.defer(WikiPage._update_related_links_locally_deferred, self.title)
+
         # delete config and tittle cache
         if self.title == '.config':
             cache.del_config()
         if self.revision == 1:
-            cache.del_titles()
+            cache.del_titles(self.title, True)
+            WikiPage._update_title_filter(self, True)
 
         return True
 
     def rebuild_data_index(self):
-        # delete all index for this page
-        index = SchemaDataIndex.query(SchemaDataIndex.title == self.title).fetch()
+        WikiPage._rebuild_data_indice([self])
 
-        keys = [i.key for i in index]
-        ndb.delete_multi(keys)
+    @classmethod
+    def _rebuild_data_indice(cls, pages):
+        """Rebuilds schema data index of pages with a single batch of writes"""
+        futures = [SchemaDataIndex.query(SchemaDataIndex.title == page.title)
+                   .fetch_async(projection=[SchemaDataIndex.name, SchemaDataIndex.value])
+                   for page in pages]
+
+        puts = []
+        stale = []
+        deltas = {}
+        for page, future in zip(pages, futures):
+            index = future.get_result()
+            try:
+                data = page.data
+            except ValueError as e:
+                logging.warning(u'Cannot index data of %s: %s' % (page.title, e))
+                continue
 
-        # insert
-        data = self.data
-        for name, value in self._data_as_pairs(data):
-            i = SchemaDataIndex(title=self.title, name=name, value=value, data=data)
-            i.put()
+            # rows of other keys are stale or written before keys were deterministic
+            existing = set(i.key for i in index)
+            keys = set()
+            for name, value in page._data_as_pairs(data):
+                key = SchemaDataIndex._key_of(page.title, name, value)
+                keys.add(key)
+                puts.append(SchemaDataIndex.create(page.title, name, value, data))
+                if key not in existing:
+                    deltas[(name, value)] = deltas.get((name, value), 0) + 1
+            for i in index:
+                if i.key not in keys:
+                    stale.append(i.key)
+                    deltas[(i.name, i.value)] = deltas.get((i.name, i.value), 0) - 1
+
+        ndb.put_multi(puts)
+        ndb.delete_multi(stale)
+        SchemaDataCount.update(deltas)
 
     def _data_as_pairs(self, data):
         pairs = set([])
@@ -689,14 +806,11 @@ class WikiPage(ndb.Model, PageOperationMixin):
         inserts = new_pairs.difference(old_pairs)
         deletes = old_pairs.difference(new_pairs)
 
-        # insert
-        indice = [SchemaDataIndex(title=self.title, name=name, value=value, data=new_data) for name, value in inserts]
-        ndb.put_multi(indice)
+        SchemaDataIndex.update(self.title, inserts, deletes, new_data)
 
-        # delete
-        keys = [SchemaDataIndex(title=self.title, name=name, value=value, data=new_data).key for name, value in deletes]
-        keys = [key for key in keys if key is not None]
-        ndb.delete_multi(keys)
+        deltas = dict((pair, 1) for pair in inserts)
+        deltas.update((pair, -1) for pair in deletes)
+        SchemaDataCount.update(deltas)
 
     @property
     def revisions(self):
@@ -705,7 +819,14 @@ class WikiPage(ndb.Model, PageOperationMixin):
     @property
     def link_scoretable(self):
         """Returns all links ordered by score"""
+        value = cache.get_link_scoretable(self.title)
+        if value is None:
+            # kept as list of (title, score) pairs which is more compact than dict
+            value = self._link_scoretable().items()
+            cache.set_link_scoretable(self.title, value)
+        return OrderedDict(value)
 
+    def _link_scoretable(self):
         # related links
         related_links_scoretable = self.related_links
 
@@ -725,6 +846,9 @@ class WikiPage(ndb.Model, PageOperationMixin):
 
     def update_links(self, old_redir, new_redir):
         """Updates outlinks of this page and inlinks of target pages"""
+        added_backlinks = []
+        removed_backlinks = []
+
         # 1. process "redirect" metadata
         if old_redir != new_redir:
             if old_redir is not None:
@@ -745,6 +869,8 @@ class WikiPage(ndb.Model, PageOperationMixin):
                     page.put()
                     cache.del_rendered_body(page.title)
                     cache.del_hashbangs(page.title)
+                    removed_backlinks.append((source.title, rel, t))
+                    added_backlinks.append((target.title, rel, t))
 
                 target.add_inlinks(source.inlinks[rel], rel)
                 del source.inlinks[rel]
@@ -760,9 +886,7 @@ class WikiPage(ndb.Model, PageOperationMixin):
         cur_outlinks = self.outlinks or {}
         new_outlinks = {}
         for rel, titles in self._parse_outlinks().items():
-            new_outlinks[rel] =\
-                [WikiPage.get_by_title(t, follow_redirect=True).title
-                 for t in titles]
+            new_outlinks[rel] = [WikiPage.resolve_redirect(t) for t in titles]
             new_outlinks[rel] = list(set(new_outlinks[rel]))
 
         if self.acl_read:
@@ -799,20 +923,24 @@ class WikiPage(ndb.Model, PageOperationMixin):
                 for title in titles:
                     page = WikiPage.get_by_title(title)
                     page.add_inlink(self.title, rel)
+                    page.add_related_links_churn()
                     page.put()
                     cache.del_rendered_body(page.title)
                     cache.del_hashbangs(page.title)
+                    added_backlinks.append((page.title, rel, self.title))
             for rel, titles in removed_outlinks.items():
                 for title in titles:
                     page = WikiPage.get_by_title(title, follow_redirect=True)
                     try:
                         page.del_inlink(self.title, rel)
+                        page.add_related_links_churn()
                         if page.inlinks == {} and page.revision == 0:
                             page.put().delete()
                         else:
                             page.put()
                         cache.del_rendered_body(page.title)
                         cache.del_hashbangs(page.title)
+                        removed_backlinks.append((page.title, rel, self.title))
                     except ValueError:
                         pass
 
@@ -822,6 +950,22 @@ class WikiPage(ndb.Model, PageOperationMixin):
             self.outlinks[rel].sort()
         self.put()
 
+        # update sorted backlink store
+        Backlink.update(added_backlinks, removed_backlinks)
+
+    def get_inlinks_page(self, rel, cursor=None, limit=100):
+        """Returns (titles, next_cursor) of incoming links with given rel"""
+        titles, next_cursor = Backlink.fetch_page(self.title, rel, cursor, limit)
+
+        # backlinks of pages saved before Backlink existed. such a page may
+        # have gained some backlinks since then, so compare counts
+        sources = set(self.inlinks.get(rel, []))
+        if cursor is None and len(sources) > 0 and Backlink.count(self.title, rel, len(sources)) < len(sources):
+            Backlink.update([(self.title, rel, t) for t in sources], [])
+            titles, next_cursor = Backlink.fetch_page(self.title, rel, cursor, limit)
+
+        return titles, next_cursor
+
     def _publish(self, title, save):
         if self.published_at is not None and self.published_to == title:
             return
@@ -886,7 +1030,20 @@ class WikiPage(ndb.Model, PageOperationMixin):
             self.put()
 
     def get_similar_titles(self, user):
-        return WikiPage._similar_titles(WikiPage.get_titles(user), self.title)
+        titles = WikiPage.get_titles(user)
+        if titleindex.has_chosung(self.title):
+            groups = WikiPage._similar_titles_by_chosung(WikiPage.get_chosung_index(), self.title, titles)
+        else:
+            matches = [(title, kind) for title, kind in WikiPage.get_trigram_index().search(self.title)
+                       if title in titles]
+            groups = WikiPage._group_similar_titles(matches)
+
+        # did you mean
+        found = set(reduce(lambda a, b: a + b, groups.values(), []))
+        suggestions = WikiPage.get_fuzzy_index().suggest(self.title, titles=titles)
+        groups[u'suggestions'] = [title for title in suggestions
+                                  if title not in found and title != self.title]
+        return groups
 
     def update_related_links(self, max_distance=5):
         """Update related_links score table by random walk"""
@@ -903,6 +1060,97 @@ class WikiPage(ndb.Model, PageOperationMixin):
 
         self.related_links = score_table
         self.normalize_related_links()
+        self._set_related_links_updated()
+
+    def update_related_links_locally(self, threshold=0.01, max_neighbors=20):
+        """Refreshes related links of this page and its neighbors by local
+        push approximation of personalized PageRank.
+
+        Only neighbors whose relatedness to this page moved more than
+        `threshold` are updated.
+        """
+        scores = self._local_related_scores(WikiPage.get_link_graph())
+        old_scores = self.related_links or {}
+
+        # this page
+        self._set_related_links_by_scores(scores)
+        keys = [self.key]
+
+        # neighbors whose score moved
+        deltas = [(title, abs(scores.get(title, 0.0) - old_scores.get(title, 0.0)))
+                  for title in set(scores.keys() + old_scores.keys())]
+        deltas = [(title, delta) for title, delta in deltas if delta > threshold]
+        for title, _ in heapq.nlargest(max_neighbors, deltas, key=operator.itemgetter(1)):
+            page = WikiPage.get_by_title(title)
+            if page.revision > 0:
+                keys.append(page.key)
+
+        def update(page):
+            if page.key == self.key:
+                page._set_related_links_by_scores(scores)
+                return
+            if page.related_links is None:
+                page.related_links = {}
+            if page.title in scores:
+                page.related_links[self.title] = scores[page.title]
+            else:
+                page.related_links.pop(self.title, None)
+            page.normalize_related_links()
+        WikiPage._put_related_links(keys, update)
+
+    @classmethod
+    def _update_related_links_locally_deferred(cls, title):
+        cls.get_by_title(title).update_related_links_locally()
+
+    def _local_related_scores(self, link_graph):
+        """Returns dict of title -> relatedness to this page by local push.
+
+        Outlinks of other pages are read from link graph snapshot if
+        possible, so that the cost does not grow with the number of hops.
+        """
+        def outlinks_of(title):
+            if title == self.title:
+                page = self
+            elif link_graph is not None and title in link_graph.ids:
+                return [link_graph.titles[t] for t in link_graph.outlinks(link_graph.ids[title])]
+            else:
+                page = WikiPage.get_by_title(title)
+            if page.acl_read:
+                return []
+            return sorted(set(reduce(lambda a, b: a + b, page.outlinks.values(), [])))
+
+        scores = graph.local_push(outlinks_of, self.title, max_pushes=200)
+        scores.pop(self.title, None)
+        return scores
+
+    def _related_scores(self, link_graph, scorer=None):
+        """Returns dict of title -> relatedness to this page.
+
+        `scorer` is one of `pagerank`, `cocitation`, `coupling` and `both`
+        (see graph.link_similarity()) and defaults to `related_links_scorer`
+        of service config. Pages missing from link graph snapshot fall back to
+        local push.
+        """
+        if scorer is None:
+            scorer = WikiPage.get_config()['service'].get('related_links_scorer', 'pagerank')
+        if link_graph is None or self.title not in link_graph.ids:
+            return self._local_related_scores(link_graph)
+
+        node = link_graph.ids[self.title]
+        limit = 30 + self.outlink_count + self.inlink_count
+        if scorer == 'pagerank':
+            related = graph.related_nodes(link_graph, node, limit=limit)
+        else:
+            related = graph.link_similarity(link_graph, node, scorer, limit=limit)
+        return dict((link_graph.titles[n], score) for n, score in related)
+
+    def _set_related_links_by_scores(self, scores):
+        # fetch more than needed since direct links will be filtered out
+        self.related_links = dict(heapq.nlargest(30 + self.outlink_count + self.inlink_count,
+                                                 scores.iteritems(),
+                                                 key=operator.itemgetter(1)))
+        self.normalize_related_links()
+        self._set_related_links_updated()
 
     def normalize_related_links(self):
         related_links = self.related_links
@@ -974,34 +1222,133 @@ class WikiPage(ndb.Model, PageOperationMixin):
 
     @classmethod
     def search(cls, expression):
+        """Returns OrderedDict of title -> score of related page search
+        expression in descending order of score."""
+        return search.sort_scores(cls.search_scores(expression))
+
+    @classmethod
+    def search_scores(cls, expression):
+        """Returns unsorted dict of title -> score of related page search
+        expression. Use search.split_scores() to take top scores of it."""
         # parse
         parsed = search.parse_expression(expression)
+        pos = sorted(set(cls.resolve_redirect(t) for t in parsed['pos']))
+        neg = sorted(set(cls.resolve_redirect(t) for t in parsed['neg']))
+
+        # cached result is valid until link_scoretable of any operand changes
+        normalized = search.format_expression(pos, neg)
+        generations = cache.get_generations([u'link_scoretable\t%s' % t for t in pos + neg])
+        scoretable = cache.get_search_result(normalized, generations)
+        if scoretable is not None:
+            return scoretable
 
         # evaluate
-        pos, neg = parsed['pos'], parsed['neg']
         pos_pages = [cls.get_by_title(t, True) for t in pos]
         neg_pages = [cls.get_by_title(t, True) for t in neg]
-        scoretable = search.evaluate(
+        scoretable = search.calculate_scores(
             dict((page.title, page.link_scoretable) for page in pos_pages),
             dict((page.title, page.link_scoretable) for page in neg_pages)
         )
 
+        cache.set_search_result(normalized, generations, scoretable)
         return scoretable
 
     @classmethod
-    def randomly_update_related_links(cls, iteration, recent=False):
-        if recent:
-            titles = [p.title for p in WikiPage.get_changes(None)][:iteration]
-        else:
-            titles = WikiPage.get_titles()
+    def update_stale_related_links(cls, batch_size=50):
+        """Refreshes related_links of pages which are due first.
+
+        Pages are taken in order of `related_links_due_at`, so pages which
+        have not been refreshed for long or have been edited, relinked or
+        viewed a lot since then come first. Returns titles of updated pages.
+        """
+        q = WikiPage.query(ancestor=cls._key()).order(WikiPage.related_links_due_at)
+        pages = [page for page in q.fetch(batch_size) if page.revision > 0]
+
+        link_graph = cls.get_link_graph()
+        scores = dict((page.key, page._related_scores(link_graph)) for page in pages)
+        # pages are put even if unchanged, so that they are no longer due
+        updated = cls._put_related_links(scores.keys(),
+                                         lambda page: page._set_related_links_by_scores(scores[page.key]),
+                                         skip_unchanged=False)
+        updated_keys = set(page.key for page in updated)
+        return [page.title for page in pages if page.key in updated_keys]
+
+    @classmethod
+    def add_related_links_views(cls, title):
+        page = cls.get_by_title(title)
+        if page.revision == 0:
+            return
+
+        def txn():
+            p = page.key.get()
+            p.add_related_links_churn()
+            p.put()
+        ndb.transaction(txn)
+
+    @classmethod
+    def update_all_related_links(cls, num_shards=8):
+        """Recomputes related_links of all pages from new link graph snapshot"""
+        link_graph = cls.build_link_graph()
+        titles = link_graph.titles
+        if len(titles) == 0:
+            return
+
+        num_shards = min(num_shards, len(titles))
+        bounds = [titles[len(titles) * i // num_shards] for i in range(num_shards)]
+        for lo, hi in zip(bounds, bounds[1:] + [None]):
+            deferred.defer(cls._update_related_links_shard, lo, hi)
+
+    @classmethod
+    def _update_related_links_shard(cls, lo, hi, cursor=None, batch_size=100):
+        """Updates related_links of pages whose title is in [lo, hi)"""
+        link_graph = cls.get_link_graph()
+        scorer = cls.get_config()['service'].get('related_links_scorer', 'pagerank')
+
+        q = WikiPage.query(ancestor=cls._key()).filter(WikiPage.title >= lo)
+        if hi is not None:
+            q = q.filter(WikiPage.title < hi)
+        q = q.order(WikiPage.title)
+        start_cursor = Cursor(urlsafe=cursor) if cursor else None
+        pages, next_cursor, more = q.fetch_page(batch_size, start_cursor=start_cursor)
+
+        scores = dict((page.key, page._related_scores(link_graph, scorer)) for page in pages
+                      if page.revision > 0 and page.title in link_graph.ids)
+        updated = cls._put_related_links(scores.keys(),
+                                         lambda page: page._set_related_links_by_scores(scores[page.key]))
+
+        logging.debug('Updating related links: %s ~ %s, %d pages' % (lo, hi, len(updated)))
+        if more and next_cursor:
+            deferred.defer(cls._update_related_links_shard, lo, hi, next_cursor.urlsafe())
 
-        if len(titles) > iteration:
-            titles = random.sample(titles, iteration)
-        for title in titles:
-            page = cls.get_by_title(title, follow_redirect=True)
-            page.update_related_links()
+    @classmethod
+    def _put_related_links(cls, keys, update, skip_unchanged=True):
+        """Re-reads each page of `keys`, applies `update` and puts it in a
+        transaction, so that edits saved while related links were being
+        computed are not overwritten. Pages whose related links did not
+        change are not put if `skip_unchanged`. Returns updated pages.
+
+        Every page shares one entity group, so pages are written one by one
+        rather than holding the group for a whole batch.
+        """
+        def txn(key):
+            page = key.get()
+            if page is None or page.revision == 0:
+                return None
+            old_related_links = dict(page.related_links or {})
+            update(page)
+            if skip_unchanged and (page.related_links or {}) == old_related_links:
+                return None
             page.put()
-        return titles
+            return page
+
+        pages = []
+        for key in keys:
+            page = ndb.transaction(lambda: txn(key))
+            if page is not None:
+                cache.del_rendered_body(page.title)
+                cache.del_hashbangs(page.title)
+                pages.append(page)
+        return pages
 
     @classmethod
     def _update_related_links(cls, start_page, page, score, score_table,
@@ -1044,9 +1391,15 @@ class WikiPage(ndb.Model, PageOperationMixin):
 
     @classmethod
     def get_index(cls, user=None):
-        q = WikiPage.query(ancestor=WikiPage._key())
+        pages = cls._get_index_pages()
+        default_permission = PageOperationMixin.get_default_permission()
+        return [page for page in pages
+                if page.updated_at and page.can_read(user, default_permission)]
 
-        pages = q.order(WikiPage.title).fetch(projection=[
+    @classmethod
+    def _get_index_pages(cls):
+        q = WikiPage.query(ancestor=WikiPage._key())
+        return q.order(WikiPage.title).fetch(projection=[
             WikiPage.title,
             WikiPage.acl_write,
             WikiPage.acl_read,
@@ -1054,9 +1407,67 @@ class WikiPage(ndb.Model, PageOperationMixin):
             WikiPage.modifier,
             WikiPage.updated_at])
 
-        default_permission = PageOperationMixin.get_default_permission()
-        return [page for page in pages
-                if page.updated_at and page.can_read(user, default_permission)]
+    @classmethod
+    def title_exists(cls, title):
+        """Approximate existence check without datastore access"""
+        try:
+            return title in cls.get_title_filter()
+        except Exception:
+            # cannot tell. don't mark it as missing
+            return True
+
+    @classmethod
+    def get_title_filter(cls):
+        title_filter = cache.get_instance('title_filter')
+        if title_filter is None:
+            title_filter = cache.get_title_filter()
+            if title_filter is None:
+                title_filter = cls.rebuild_title_filter()
+            cache.set_instance('title_filter', title_filter)
+        return title_filter
+
+    @classmethod
+    def rebuild_title_filter(cls):
+        titles = [page.title for page in cls._get_index_pages() if page.updated_at]
+        title_filter = titleindex.TitleFilter(titles)
+        cache.set_title_filter(title_filter)
+        return title_filter
+
+    @classmethod
+    def _update_title_filter(cls, page, exists):
+        # links to this page should be rendered again
+        for titles in page.inlinks.values():
+            for title in titles:
+                cache.del_rendered_body(title)
+
+        def update(title_filter):
+            if title_filter.changes >= cls.max_title_filter_changes:
+                return False
+            if exists:
+                title_filter.add(page.title)
+            else:
+                title_filter.remove(page.title)
+            return True
+
+        # concurrent updates are retried, or the filter is dropped and rebuilt
+        # on next use, so that no existing page goes missing from it
+        if not cache.update_title_filter(update):
+            cache.del_title_filter()
+
+    @classmethod
+    def get_most_linked(cls, limit=20, user=None):
+        """Returns list of (title, inlink count) ordered by inlink count"""
+        q = WikiPage.query(ancestor=WikiPage._key())
+        q = q.order(-WikiPage.inlink_count)
+        accessible_titles = cls.get_titles(user)
+
+        result = []
+        for page in q.iter(projection=[WikiPage.title, WikiPage.inlink_count]):
+            if page.inlink_count == 0 or len(result) == limit:
+                break
+            if page.title in accessible_titles:
+                result.append((page.title, page.inlink_count))
+        return result
 
     @classmethod
     def get_titles(cls, user=None):
@@ -1068,6 +1479,102 @@ class WikiPage(ndb.Model, PageOperationMixin):
 
         return titles
 
+    @classmethod
+    def get_title_index(cls):
+        """Returns prefix index of titles of all pages, ranked by inlinks.
+
+        Shared by all users, so completions should be limited to
+        get_titles(). Kept in instance memory until set of titles changes.
+        """
+        index = cache.get_instance('title_index', 'titles')
+        if index is None:
+            index = titleindex.PrefixIndex(cls._get_all_titles(), cls._get_title_popularity())
+            cache.set_instance('title_index', index, 'titles')
+        return index
+
+    @classmethod
+    def get_fuzzy_index(cls):
+        """Returns edit distance index of normalized titles of all pages.
+        Shared by all users and caught up like get_trigram_index()."""
+        return cls._get_incremental_title_index(
+            'fuzzy_index',
+            lambda: titleindex.FuzzyIndex(cls._get_all_titles(), cls._normalize_title,
+                                          cls._get_title_popularity()))
+
+    @classmethod
+    def _get_title_popularity(cls):
+        q = WikiPage.query(ancestor=cls._key()).order(-WikiPage.inlink_count)
+        return dict((page.title, page.inlink_count)
+                    for page in q.fetch(projection=[WikiPage.title, WikiPage.inlink_count]))
+
+    @classmethod
+    def get_chosung_index(cls):
+        """Returns chosung index of titles of all pages. Shared by all users,
+        so matches should be limited to get_titles()."""
+        index = cache.get_instance('chosung_index', 'titles')
+        if index is None:
+            index = titleindex.ChosungIndex(cls._get_all_titles())
+            cache.set_instance('chosung_index', index, 'titles')
+        return index
+
+    @classmethod
+    def get_trigram_index(cls):
+        """Returns trigram index of normalized titles of all pages.
+
+        Shared by all users, so results should be filtered by get_titles().
+        Kept in instance memory and caught up with pages created or deleted
+        since by TrigramIndex.add() and remove(). Rebuilt only if the log of
+        those changes is not available.
+        """
+        return cls._get_incremental_title_index(
+            'trigram_index',
+            lambda: titleindex.TrigramIndex(cls._get_all_titles(), cls._normalize_title))
+
+    @classmethod
+    def _get_incremental_title_index(cls, name, build):
+        with _title_index_lock:
+            generation, index = cache.get_instance_entry(name)
+            current = cache.get_generation('titles')
+            if index is not None and generation != current:
+                changes = cache.get_title_changes(generation, current)
+                if changes is None:
+                    index = None
+                else:
+                    for title, exists in changes:
+                        if exists:
+                            index.add(title)
+                        else:
+                            index.remove(title)
+                    cache.set_instance(name, index, 'titles')
+            if index is None:
+                index = build()
+                cache.set_instance(name, index, 'titles')
+        return index
+
+    @classmethod
+    def _get_all_titles(cls):
+        return [page.title for page in cls._get_index_pages() if page.updated_at]
+
+    @classmethod
+    def complete_titles(cls, q, user=None, limit=20):
+        """Returns titles starting with q, or matching q by initial
+        consonants if q has any. Falls back to titles similar to q."""
+        readable = cls.get_titles(user)
+        titles = cls.get_title_index().complete(q, limit, readable)
+        if titleindex.has_chosung(q) and len(titles) < limit:
+            matches = [(title, start) for title, start in cls.get_chosung_index().search(q)
+                       if title in readable]
+            matches.sort(key=lambda (title, start): start != 0)
+            for title, _ in matches:
+                if len(titles) == limit:
+                    break
+                if title not in titles:
+                    titles.append(title)
+        if len(titles) == 0 and len(q) >= 3:
+            # nothing found. maybe a typo
+            titles = cls.get_fuzzy_index().suggest(q, limit, titles=readable)
+        return titles
+
     @staticmethod
     def get_published_posts(title, limit):
         q = WikiPage.query(ancestor=WikiPage._key())
@@ -1131,12 +1638,15 @@ class WikiPage(ndb.Model, PageOperationMixin):
         results = cache.get_wikiquery(q, email)
         if results is None:
             page_query, attrs = search.parse_wikiquery(q)
-            datas = cls._evaluate_pages(page_query)
             accessible_titles = WikiPage.get_titles(user)
+            titles = [t for t in cls._evaluate_pages(page_query) if t in accessible_titles]
+            datas = cls._get_page_data(titles, attrs)
 
             results = []
             for title, data in datas.items():
-                if title in accessible_titles:
+                if attrs == ['*']:
+                    results.append(data)
+                else:
                     results.append(OrderedDict((attr, data[attr] if attr in data else None) for attr in attrs))
 
             if len(results) == 1:
@@ -1147,44 +1657,163 @@ class WikiPage(ndb.Model, PageOperationMixin):
 
     @classmethod
     def _evaluate_pages(cls, q):
+        """Returns set of titles of pages matching page query q.
+
+        Operands of `*` are evaluated from the most selective one, estimated
+        by SchemaDataCount, and each one only checks pages matched so far.
+        """
+        estimates = SchemaDataCount.get_estimates(cls._page_query_terms(q))
+        return cls._evaluate_titles(q, estimates, None)
+
+    @classmethod
+    def _get_page_data(cls, titles, attrs):
+        """Returns dict of title -> data of pages, having only attrs of them.
+
+        Values are read from projections of SchemaDataIndex. When attrs is
+        ['*'], whole data is read from the pages themselves, since data
+        stored in index rows is not rewritten when other values of the page
+        change. A name with multiple values has list of them in index order.
+        """
+        if attrs == ['*']:
+            futures = [WikiPage.query(WikiPage.title == title, ancestor=cls._key()).get_async()
+                       for title in titles]
+            pages = [f.get_result() for f in futures]
+            return dict((page.title, page.data) for page in pages if page is not None)
+
+        if len(attrs) == 1:
+            query = SchemaDataIndex.query(SchemaDataIndex.name == attrs[0])
+            projection = [SchemaDataIndex.value]
+        else:
+            query = SchemaDataIndex.query()
+            projection = [SchemaDataIndex.name, SchemaDataIndex.value]
+        futures = [(title, query.filter(SchemaDataIndex.title == title).fetch_async(projection=projection))
+                   for title in titles]
+
+        datas = {}
+        for title, future in futures:
+            data = datas[title] = {}
+            for i in future.get_result():
+                name = attrs[0] if len(attrs) == 1 else i.name
+                if name not in attrs:
+                    continue
+                if name not in data:
+                    data[name] = i.value
+                elif type(data[name]) != list:
+                    if data[name] != i.value:
+                        data[name] = [data[name], i.value]
+                elif i.value not in data[name]:
+                    data[name].append(i.value)
+        return datas
+
+    @classmethod
+    def _page_query_terms(cls, q):
+        """Returns list of (name, value) of terms in page query q, except comparisons"""
         if len(q) == 1:
-            pages = cls._evaluate_pages(q[0])
-        elif len(q) == 2:
-            pages = cls._evaluate_page_query_term(q[0], q[1])
+            return cls._page_query_terms(q[0])
+        elif search.is_page_query_term(q):
+            return [cls._page_query_term(q[0], q[1])] if len(q) == 2 else []
         else:
-            pages = cls._evaluate_page_query_expr(q[0], q[1], q[2:])
-        return pages
+            terms = []
+            for operand in q[::2]:
+                terms += cls._page_query_terms(operand)
+            return terms
 
     @classmethod
-    def _evaluate_page_query_term(cls, name, value):
+    def _page_query_term(cls, name, value):
         if name == 'schema' and value.find('/') == -1:
             value = schema.get_itemtype_path(value)
+        return name, value
 
-        pages = {}
-
-        for index in SchemaDataIndex.query(SchemaDataIndex.name == name, SchemaDataIndex.value == value):
-            pages[index.title] = index.data
+    @classmethod
+    def _estimate(cls, q, estimates):
+        if len(q) == 1:
+            return cls._estimate(q[0], estimates)
+        elif search.is_page_query_term(q):
+            # size of ranges is unknown
+            return estimates[cls._page_query_term(q[0], q[1])] if len(q) == 2 else float('inf')
 
-        return pages
+        operands = [cls._estimate(operand, estimates) for operand in q[::2]]
+        return min(operands) if q[1] == '*' else sum(operands)
 
     @classmethod
-    def _evaluate_page_query_expr(cls, operand, op, rest):
-        pages1 = cls._evaluate_pages(operand)
-        pages2 = cls._evaluate_pages(rest)
-        pages = {}
+    def _evaluate_titles(cls, q, estimates, candidates):
+        """Returns set of titles matching q, restricted to candidates if given"""
+        if len(q) == 1:
+            return cls._evaluate_titles(q[0], estimates, candidates)
+        elif search.is_page_query_term(q) and len(q) == 2:
+            name, value = cls._page_query_term(q[0], q[1])
+            return cls._evaluate_page_query_term(name, value, estimates[(name, value)], candidates)
+        elif search.is_page_query_term(q):
+            return cls._evaluate_page_query_comparison(q[0], q[1], q[2], candidates)
+
+        operands = q[::2]
+        if q[1] == '+':
+            titles = set()
+            for operand in operands:
+                titles.update(cls._evaluate_titles(operand, estimates, candidates))
+            return titles
+
+        titles = candidates
+        for operand in sorted(operands, key=lambda o: cls._estimate(o, estimates)):
+            titles = cls._evaluate_titles(operand, estimates, titles)
+            if len(titles) == 0:
+                break
+        return titles
 
-        if op == '*':
-            keys = set(pages1.keys()).intersection(set(pages2.keys()))
-            for key in keys:
-                if key in pages1:
-                    pages[key] = pages1[key]
-                else:
-                    pages[key] = pages2[key]
-        elif op == '+':
-            keys = set(pages1.keys()).union(set(pages2.keys()))
-            pages = dict((k, v) for k, v in (pages1.items() + pages2.items()) if k in keys)
+    @classmethod
+    def _evaluate_page_query_term(cls, name, value, estimate, candidates):
+        query = SchemaDataIndex.query(SchemaDataIndex.name == name, SchemaDataIndex.value == value)
+
+        if candidates is not None and len(candidates) <= SchemaDataCount.max_probes and \
+                len(candidates) * SchemaDataCount.probe_cost < estimate:
+            # check each candidate rather than scanning every match
+            futures = [(title, query.filter(SchemaDataIndex.title == title).get_async(keys_only=True))
+                       for title in candidates]
+            return set(title for title, f in futures if f.get_result() is not None)
+
+        titles = set(i.title for i in query.fetch(projection=[SchemaDataIndex.title]))
+        if candidates is not None:
+            titles.intersection_update(candidates)
+        return titles
 
-        return pages
+    @classmethod
+    def _evaluate_page_query_comparison(cls, name, op, value, candidates):
+        """Returns set of titles whose value of name compares to value by op.
+
+        Values of date properties are compared as periods (e.g. `<= "2013"`
+        includes whole 2013), values looking like numbers as numbers and
+        the others as strings. Each comparison is a single range scan.
+        """
+        is_date = schema.get_property_type(name) == 'date'
+        period = schema.parse_date_period(value) if is_date else None
+        number = schema.parse_number(value) if not is_date else None
+        if op == '^=':
+            # U+10FFFF is the largest code point, so that prefixed values with
+            # characters beyond BMP fall in the range as well
+            prop, lower, upper = SchemaDataIndex.value, value, value + u'\U0010ffff'
+        elif period is not None:
+            prop, lower, upper = SchemaDataIndex.date_value, period[0], period[1]
+        elif number is not None:
+            prop, lower, upper = SchemaDataIndex.number_value, number, number
+        else:
+            prop, lower, upper = SchemaDataIndex.value, value, value
+
+        query = SchemaDataIndex.query(SchemaDataIndex.name == name)
+        if op == '^=':
+            query = query.filter(prop >= lower, prop < upper)
+        elif op == '>=':
+            query = query.filter(prop >= lower)
+        elif op == '>':
+            query = query.filter(prop >= upper) if period is not None else query.filter(prop > upper)
+        elif op == '<':
+            query = query.filter(prop < lower)
+        elif op == '<=':
+            query = query.filter(prop < upper) if period is not None else query.filter(prop <= upper)
+
+        titles = set(i.title for i in query.fetch(projection=[SchemaDataIndex.title]))
+        if candidates is not None:
+            titles.intersection_update(candidates)
+        return titles
 
     @classmethod
     def get_by_title(cls, title, follow_redirect=False):
@@ -1193,17 +1822,64 @@ class WikiPage(ndb.Model, PageOperationMixin):
         if title[0] == u'=':
             raise ValueError(u'WikiPage title cannot starts with "="')
 
+        if not follow_redirect:
+            return cls._get_by_title(title)
+
+        redirects = cls.get_redirect_map()
+        page = cls._get_by_title(redirects.get(title, title))
+
+        # redirect map does not know about this page (e.g. the page was saved
+        # before WikiPage.redirect existed). follow metadata instead.
+        if page.title not in redirects:
+            visited = set([page.title])
+            while 'redirect' in page.metadata and page.metadata['redirect'] not in visited:
+                page = cls._get_by_title(page.metadata['redirect'])
+                visited.add(page.title)
+
+        return page
+
+    @classmethod
+    def _get_by_title(cls, title):
         key = cls._key()
         page = WikiPage.query(WikiPage.title == title, ancestor=key).get()
         if page is None:
             page = WikiPage(parent=key, title=title, body=u'', revision=0,
                             inlinks={}, outlinks={}, related_links={})
-        elif follow_redirect and 'redirect' in page.metadata:
-            new_title = page.metadata['redirect']
-            page = cls.get_by_title(new_title, follow_redirect)
-
         return page
 
+    @classmethod
+    def resolve_redirect(cls, title):
+        """Returns final target title of redirect chain starting from title"""
+        return cls.get_redirect_map().get(title, title)
+
+    @classmethod
+    def get_redirect_map(cls):
+        """Returns dict of redirecting title to its final target title"""
+        redirects = cache.get_instance('redirects')
+        if redirects is None:
+            edges = cache.get_redirects()
+            if edges is None:
+                q = WikiPage.query(WikiPage.redirect > u'', ancestor=cls._key())
+                pages = q.fetch(projection=[WikiPage.title, WikiPage.redirect])
+                edges = dict((page.title, page.redirect) for page in pages)
+                cache.set_redirects(edges)
+            redirects = compress_redirects(edges)
+            cache.set_instance('redirects', redirects)
+        return redirects
+
+    @staticmethod
+    def fold_title(title):
+        return unicodedata.normalize('NFC', title).lower()
+
+    @classmethod
+    def get_canonical_title(cls, title):
+        """Returns title of existing page whose title differs from given one
+        only by case or unicode normalization, or None if there's no such page"""
+        q = WikiPage.query(WikiPage.folded_title == cls.fold_title(title), ancestor=cls._key())
+        titles = sorted(page.title for page in q.fetch(10, projection=[WikiPage.title, WikiPage.updated_at])
+                        if page.updated_at is not None and page.title != title)
+        return titles[0] if titles else None
+
     @classmethod
     def title_to_path(cls, title):
         return urllib2.quote(title.replace(u' ', u'_').encode('utf-8'))
@@ -1213,34 +1889,34 @@ class WikiPage(ndb.Model, PageOperationMixin):
         return urllib2.unquote(path).decode('utf-8').replace('_', ' ')
 
     @classmethod
-    def _similar_titles(cls, titles, target):
-        normalized_target = cls._normalize_title(target)
-        if len(normalized_target) == 0:
-            return OrderedDict([
-                (u'startswiths', []),
-                (u'endswiths', []),
-                (u'contains', []),
-            ])
-
-        contains = []
-        startswiths = []
-        endswiths = []
-        for title in titles:
-            normalized_title = cls._normalize_title(title)
-            if normalized_title.find(normalized_target) == -1:
+    def _similar_titles_by_chosung(cls, index, target, titles=None):
+        matches = []
+        for title, start in index.search(target):
+            if titles is not None and title not in titles:
                 continue
-            if normalized_title.startswith(normalized_target):
-                startswiths.append(title)
-            elif normalized_title.endswith(normalized_target):
-                endswiths.append(title)
+            if start == 0:
+                matches.append((title, u'startswiths'))
+            elif start + len(target) == len(title):
+                matches.append((title, u'endswiths'))
             else:
-                contains.append(title)
+                matches.append((title, u'contains'))
+        return cls._group_similar_titles(matches)
 
-        return OrderedDict([
-            (u'startswiths', startswiths),
-            (u'endswiths', endswiths),
-            (u'contains', contains),
+    @classmethod
+    def _similar_titles(cls, titles, target):
+        index = titleindex.TrigramIndex(titles, cls._normalize_title)
+        return cls._group_similar_titles(index.search(target))
+
+    @staticmethod
+    def _group_similar_titles(matches):
+        groups = OrderedDict([
+            (u'startswiths', []),
+            (u'endswiths', []),
+            (u'contains', []),
         ])
+        for title, kind in matches:
+            groups[kind].append(title)
+        return groups
 
     @classmethod
     def _normalize_title(cls, title):
@@ -1282,19 +1958,278 @@ class WikiPage(ndb.Model, PageOperationMixin):
                     del links[rel]
 
     @classmethod
-    def rebuild_all_data_index(cls, page_index=0):
-        logging.debug('Rebuilding data index: %d' % page_index)
+    def rebuild_all_data_index(cls, num_shards=8, batch_size=50):
+        """Rebuilds schema data index of all pages in parallel deferred tasks.
+
+        Pages are split into `num_shards` ranges of titles of similar size,
+        each of which is processed a batch at a time. Progress is kept in
+        DataIndexRebuild.
+        """
+        titles = [p.title for p in WikiPage.query(ancestor=cls._key()).order(WikiPage.title)
+                                           .fetch(projection=[WikiPage.title])]
+        num_shards = max(1, min(num_shards, len(titles)))
+        bounds = [titles[len(titles) * i // num_shards] for i in range(1, num_shards)]
+        ranges = zip([None] + bounds, bounds + [None])
+
+        job_id = DataIndexRebuild.start(len(titles), len(ranges))
+        for start, end in ranges:
+            deferred.defer(cls._rebuild_data_index_shard, job_id, start, end, None, batch_size)
+        return job_id
 
-        batch_size = 20
-        all_pages = list(cls.query().fetch(batch_size, offset=page_index * batch_size))
-        if len(all_pages) == 0:
-            logging.debug('Rebuilding data index: Finished!')
+    @classmethod
+    def _rebuild_data_index_shard(cls, job_id, start, end, cursor=None, batch_size=50):
+        """Rebuilds a batch of pages whose titles are in [start, end)"""
+        q = WikiPage.query(ancestor=cls._key())
+        if start is not None:
+            q = q.filter(WikiPage.title >= start)
+        if end is not None:
+            q = q.filter(WikiPage.title < end)
+        q = q.order(WikiPage.title)
+
+        start_cursor = Cursor(urlsafe=cursor) if cursor else None
+        pages, next_cursor, more = q.fetch_page(batch_size, start_cursor=start_cursor)
+        cls._rebuild_data_indice(pages)
+
+        more = more and next_cursor is not None
+        if not DataIndexRebuild.add_progress(job_id, len(pages), not more):
+            logging.debug('Rebuilding data index: job %s has been superseded' % job_id)
             return
+        if more:
+            deferred.defer(cls._rebuild_data_index_shard, job_id, start, end,
+                           next_cursor.urlsafe(), batch_size)
+
+    @classmethod
+    def compact_data_index(cls, cursor=None, batch_size=100):
+        """Removes stale rows of schema data index, a batch per deferred task.
+
+        Rows written before they were keyed by (title, name, value hash) are
+        moved to their keys, and rows no longer in data of their page are
+        deleted. Returns number of rows deleted in this batch.
+        """
+        start_cursor = Cursor(urlsafe=cursor) if cursor else None
+        index, next_cursor, more = SchemaDataIndex.query().fetch_page(batch_size,
+                                                                      start_cursor=start_cursor)
+
+        pages = dict((title, cls.get_by_title(title)) for title in set(i.title for i in index))
+        pairs = dict((title, page._data_as_pairs(page.data) if page.revision > 0 else set())
+                     for title, page in pages.items())
+
+        deletes = []
+        moves = {}
+        for i in index:
+            key = SchemaDataIndex._key_of(i.title, i.name, i.value)
+            if (i.name, i.value) not in pairs[i.title]:
+                deletes.append(i)
+            elif i.key != key:
+                deletes.append(i)
+                moves[key] = i
+
+        existing = set(i.key for i in ndb.get_multi(moves.keys()) if i is not None)
+        ndb.put_multi([SchemaDataIndex.create(i.title, i.name, i.value, pages[i.title].data)
+                       for key, i in moves.items() if key not in existing])
+        ndb.delete_multi([i.key for i in deletes])
+
+        deltas = {}
+        for key, i in moves.items():
+            if key not in existing:
+                deltas[(i.name, i.value)] = deltas.get((i.name, i.value), 0) + 1
+        for i in deletes:
+            deltas[(i.name, i.value)] = deltas.get((i.name, i.value), 0) - 1
+        SchemaDataCount.update(deltas)
+
+        logging.debug('Compacting data index: %d rows, %d deleted' % (len(index), len(deletes)))
+        if more and next_cursor:
+            deferred.defer(cls.compact_data_index, next_cursor.urlsafe(), batch_size)
+        return len(deletes)
+
+    @classmethod
+    def _update_text_index_deferred(cls, title):
+        page = cls.get_by_title(title)
+        if page.revision == 0:
+            text = u''
+        else:
+            text = u'%s\n%s' % (page.title, PageOperationMixin.remove_metadata(page.body))
+        TextDocument.update(title, text)
+
+    @classmethod
+    def rebuild_text_index(cls, cursor=None, batch_size=50):
+        """Rebuilds full-text index of all pages, a batch per deferred task"""
+        q = WikiPage.query(ancestor=cls._key()).order(WikiPage.title)
+        start_cursor = Cursor(urlsafe=cursor) if cursor else None
+        titles, next_cursor, more = q.fetch_page(batch_size, start_cursor=start_cursor,
+                                                 projection=[WikiPage.title])
+        for page in titles:
+            cls._update_text_index_deferred(page.title)
+
+        logging.debug('Rebuilding text index: %d pages' % len(titles))
+        if more and next_cursor:
+            deferred.defer(cls.rebuild_text_index, next_cursor.urlsafe(), batch_size)
 
-        for p in all_pages:
-            p.rebuild_data_index()
+    @classmethod
+    def text_search(cls, q, user=None, limit=20):
+        """Returns list of pages matching q with their snippets"""
+        terms = sorted(set(term for term, _, _ in fulltext.tokenize(q)))
+        if len(terms) == 0:
+            return []
+
+        # pages of ranked hits are fetched concurrently, `limit` at a time.
+        # at most `text_search_max_hits` hits are scanned, however many of
+        # them are unreadable.
+        results = []
+        default_permission = PageOperationMixin.get_default_permission()
+        hits = TextDocument.search(terms)[:cls.text_search_max_hits]
+        for i in range(0, len(hits), limit):
+            batch = hits[i:i + limit]
+            futures = [WikiPage.query(WikiPage.title == title, ancestor=cls._key()).get_async()
+                       for title, _ in batch]
+            for (title, score), future in zip(batch, futures):
+                page = future.get_result()
+                if page is None or page.revision == 0 or not page.can_read(user, default_permission):
+                    continue
+                snippet, highlights = fulltext.snippet(PageOperationMixin.remove_metadata(page.body), terms)
+                results.append({
+                    'title': title,
+                    'score': score,
+                    'snippet': snippet,
+                    'highlights': highlights,
+                })
+                if len(results) == limit:
+                    return results
+        return results
 
-        deferred.defer(cls.rebuild_all_data_index, page_index + 1)
+    @classmethod
+    def sweep(cls, cursor=None, batch_size=50):
+        """Removes orphaned placeholder pages, repairs asymmetric
+        inlink/outlink pairs and stores missing computed properties in one
+        batch. Returns (report, next_cursor)"""
+        q = WikiPage.query(ancestor=cls._key())
+        start_cursor = Cursor(urlsafe=cursor) if cursor else None
+        pages, next_cursor, more = q.fetch_page(batch_size, start_cursor=start_cursor)
+
+        loaded = dict((page.title, page) for page in pages)
+        dirty = set()
+        report = {
+            'pages': len(pages),
+            'inlinks': [],
+            'outlinks': [],
+            'placeholders': [],
+            'redirects': [],
+            'properties': [],
+        }
+        added_backlinks = []
+        removed_backlinks = []
+
+        def get_page(title):
+            if title not in loaded:
+                loaded[title] = cls._get_by_title(title)
+            return loaded[title]
+
+        for page in pages:
+            # remove inlinks which are not backed by outlinks of source page
+            for rel, titles in page.inlinks.items():
+                for title in set(titles):
+                    source = get_page(title)
+                    if not source.acl_read and page.title in source.outlinks.get(rel, []):
+                        continue
+                    page.inlinks[rel] = [t for t in page.inlinks[rel] if t != title]
+                    if len(page.inlinks[rel]) == 0:
+                        del page.inlinks[rel]
+                    dirty.add(page.title)
+                    removed_backlinks.append((page.title, rel, title))
+                    report['inlinks'].append(u'%s <- %s' % (page.title, title))
+
+            # add missing inlinks to target pages
+            if not page.acl_read:
+                for rel, titles in page.outlinks.items():
+                    for title in titles:
+                        target = get_page(title)
+                        if target.redirect or page.title in target.inlinks.get(rel, []):
+                            continue
+                        target.add_inlink(page.title, rel)
+                        dirty.add(target.title)
+                        added_backlinks.append((target.title, rel, page.title))
+                        report['outlinks'].append(u'%s -> %s' % (page.title, title))
+
+        # re-put redirecting pages missing from redirect map, which were saved
+        # before WikiPage.redirect existed
+        redirects = cls.get_redirect_map()
+        for page in pages:
+            if page.redirect and page.title not in redirects:
+                dirty.add(page.title)
+                report['redirects'].append(u'%s -> %s' % (page.title, page.redirect))
+
+        # re-put pages saved before some of computed properties existed
+        for page in pages:
+            if page.stored_properties_version != cls.computed_properties_version:
+                dirty.add(page.title)
+                report['properties'].append(page.title)
+
+        # remove orphaned placeholders
+        deletes = []
+        for title in list(dirty) + [page.title for page in pages]:
+            page = loaded[title]
+            if page.revision == 0 and page.key is not None and \
+                    len(page.inlinks) == 0 and len(page.outlinks) == 0:
+                deletes.append(page.key)
+                dirty.discard(title)
+                report['placeholders'].append(title)
+
+        ndb.put_multi([loaded[title] for title in dirty])
+        ndb.delete_multi(list(set(deletes)))
+        Backlink.update(added_backlinks, removed_backlinks)
+        for title in dirty:
+            cache.del_rendered_body(title)
+            cache.del_hashbangs(title)
+        if len(report['redirects']) > 0:
+            cache.del_redirects()
+
+        next_cursor = next_cursor.urlsafe() if more and next_cursor else None
+        return report, next_cursor
+
+    @classmethod
+    def sweep_all(cls, cursor=None, totals=None):
+        if totals is None:
+            totals = {'pages': 0, 'inlinks': 0, 'outlinks': 0, 'placeholders': 0, 'redirects': 0,
+                      'properties': 0}
+
+        report, next_cursor = cls.sweep(cursor)
+        for key in report.keys():
+            if key != 'pages':
+                for line in report[key]:
+                    logging.info('Sweeping: fixed %s: %s' % (key, line))
+                report[key] = len(report[key])
+            totals[key] += report[key]
+
+        if next_cursor is None:
+            logging.info('Sweeping: Finished! %s' % totals)
+            return
+
+        deferred.defer(cls.sweep_all, next_cursor, totals)
+
+    @classmethod
+    def get_link_graph(cls):
+        """Returns latest snapshot of whole link graph or None"""
+        link_graph = cache.get_instance('link_graph')
+        if link_graph is None:
+            link_graph = LinkGraphSnapshot.load()
+            if link_graph is not None:
+                cache.set_instance('link_graph', link_graph)
+        return link_graph
+
+    @classmethod
+    def build_link_graph(cls):
+        """Exports whole link graph into snapshot"""
+        links = {}
+        q = WikiPage.query(ancestor=cls._key())
+        for page in q.iter(batch_size=200):
+            # links from read restricted pages are hidden
+            links[page.title] = {} if page.acl_read else (page.outlinks or {})
+
+        link_graph = graph.LinkGraph.from_links(links)
+        LinkGraphSnapshot.save(link_graph)
+        cache.incr_generation('link_graph')
+        logging.debug('Link graph: %d pages, %d links' % (len(link_graph), link_graph.num_links))
+        return link_graph
 
     def _rev_key(self):
         return ndb.Key(u'revision', self.title)
@@ -1344,11 +2279,350 @@ class WikiPageRevision(ndb.Model, PageOperationMixin):
 
 
 class SchemaDataIndex(ndb.Model):
+    """(name, value) pair in data of a page, keyed by title, name and hash of value.
+
+    value is also kept as date or number, by type of the property, so that
+    it can be compared as such.
+    """
     title = ndb.StringProperty()
     name = ndb.StringProperty()
     value = ndb.StringProperty()
+    date_value = ndb.DateProperty()
+    number_value = ndb.FloatProperty()
     data = ndb.JsonProperty()
 
+    @classmethod
+    def create(cls, title, name, value, data):
+        date_value, number_value = schema.coerce_value(name, value)
+        return cls(key=cls._key_of(title, name, value), title=title, name=name, value=value,
+                   date_value=date_value, number_value=number_value, data=data)
+
+    @classmethod
+    def update(cls, title, inserts, deletes, data):
+        """Adds and removes (name, value) pairs of a page by blind writes"""
+        ndb.put_multi([cls.create(title, name, value, data) for name, value in inserts])
+        ndb.delete_multi([cls._key_of(title, name, value) for name, value in deletes])
+
+    @classmethod
+    def _key_of(cls, title, name, value):
+        return ndb.Key(cls, u'%s\t%s\t%s' % (title, name, cls._value_hash(value)))
+
+    @staticmethod
+    def _value_hash(value):
+        return hashlib.md5(unicode(value).encode('utf-8')).hexdigest()
+
+
+class SchemaDataCount(ndb.Model):
+    """Number of SchemaDataIndex rows of a (name, value), used to plan wikiqueries.
+
+    Counts are estimates: concurrent updates may race and they are not
+    corrected until the (name, value) is counted again.
+    """
+    # checking a page by a query costs about as much as scanning this many rows
+    probe_cost = 10
+    max_probes = 100
+
+    count = ndb.IntegerProperty(default=0, indexed=False)
+
+    @classmethod
+    def update(cls, deltas):
+        """Applies dict of (name, value) -> change in number of rows.
+
+        A (name, value) without count yet is counted from SchemaDataIndex
+        instead, so data indexed before counts were kept is filled in.
+        """
+        pairs = deltas.keys()
+        counts = ndb.get_multi([cls._key_of(name, value) for name, value in pairs])
+
+        futures = {}
+        for (name, value), count in zip(pairs, counts):
+            if count is None:
+                futures[(name, value)] = SchemaDataIndex.query(SchemaDataIndex.name == name,
+                                                               SchemaDataIndex.value == value).count_async()
+
+        updated = []
+        for (name, value), count in zip(pairs, counts):
+            if count is None:
+                count = cls(key=cls._key_of(name, value), count=futures[(name, value)].get_result())
+            elif deltas[(name, value)] != 0:
+                count.count = max(count.count + deltas[(name, value)], 0)
+            else:
+                continue
+            updated.append(count)
+        ndb.put_multi(updated)
+
+    @classmethod
+    def get_estimates(cls, pairs):
+        """Returns dict of (name, value) -> estimated number of rows.
+
+        Pairs never counted are estimated as infinite.
+        """
+        pairs = list(set(pairs))
+        counts = ndb.get_multi([cls._key_of(name, value) for name, value in pairs])
+        return dict((pair, count.count if count is not None else float('inf'))
+                    for pair, count in zip(pairs, counts))
+
+    @classmethod
+    def _key_of(cls, name, value):
+        return ndb.Key(cls, u'%s\t%s' % (name, SchemaDataIndex._value_hash(value)))
+
+
+class Backlink(ndb.Model):
+    """Incoming links sorted by source title, used to paginate inlinks"""
+    target = ndb.StringProperty()
+    rel = ndb.StringProperty()
+    source = ndb.StringProperty()
+
+    @classmethod
+    def update(cls, added, removed):
+        """Adds and removes (target, rel, source) tuples by blind writes"""
+        ndb.put_multi([cls(key=cls._key_of(target, rel, source),
+                           target=target, rel=rel, source=source)
+                       for target, rel, source in added])
+        ndb.delete_multi([cls._key_of(target, rel, source)
+                          for target, rel, source in removed])
+
+    @classmethod
+    def count(cls, target, rel, limit=None):
+        return cls.query(cls.target == target, cls.rel == rel).count(limit)
+
+    @classmethod
+    def fetch_page(cls, target, rel, cursor=None, limit=100):
+        q = cls.query(cls.target == target, cls.rel == rel).order(cls.source)
+        start_cursor = Cursor(urlsafe=cursor) if cursor else None
+        results, next_cursor, more = q.fetch_page(limit,
+                                                  start_cursor=start_cursor,
+                                                  projection=[cls.source])
+        next_cursor = next_cursor.urlsafe() if more and next_cursor else None
+        return [b.source for b in results], next_cursor
+
+    @classmethod
+    def _key_of(cls, target, rel, source):
+        return ndb.Key(cls, u'%s\t%s\t%s' % (target, rel, source))
+
+
+class LinkGraphSnapshot(ndb.Model):
+    """Compressed link graph split into chunks.
+
+    Entity with id "head" holds version and number of chunks. Chunks are
+    stored in entities with id "chunk\t<version>\t<index>" and head is written
+    last, so readers never mix chunks of different snapshots. Chunks of the
+    previous version are kept for readers which already read the old head.
+    """
+    chunk_size = 900 * 1024
+
+    data = ndb.BlobProperty()
+    num_chunks = ndb.IntegerProperty()
+    created_at = ndb.DateTimeProperty()
+    version = ndb.StringProperty()
+    prev_version = ndb.StringProperty()
+    prev_num_chunks = ndb.IntegerProperty()
+
+    @classmethod
+    def save(cls, link_graph):
+        blob = link_graph.dumps()
+        chunks = [blob[i:i + cls.chunk_size] for i in range(0, len(blob), cls.chunk_size)]
+        now = datetime.now()
+        version = now.strftime('%Y%m%d%H%M%S%f')
+
+        ndb.put_multi([cls(key=cls._chunk_key(version, i), data=chunk) for i, chunk in enumerate(chunks)])
+        old = cls.get_by_id(u'head')
+        cls(id=u'head', num_chunks=len(chunks), created_at=now, version=version,
+            prev_version=old.version if old else None,
+            prev_num_chunks=old.num_chunks if old else None).put()
+
+        if old is not None and old.prev_num_chunks is not None and old.prev_version != version:
+            ndb.delete_multi([cls._chunk_key(old.prev_version, i) for i in range(old.prev_num_chunks)])
+
+    @classmethod
+    def load(cls):
+        head = cls.get_by_id(u'head')
+        if head is None:
+            return None
+        keys = [cls._chunk_key(head.version, i) for i in range(head.num_chunks)]
+        chunks = ndb.get_multi(keys)
+        if None in chunks:
+            return None
+        try:
+            return graph.LinkGraph.loads(''.join(chunk.data for chunk in chunks))
+        except (zlib.error, struct.error, ValueError) as e:
+            logging.warning('Cannot load link graph snapshot %s: %s' % (head.version, e))
+            return None
+
+    @classmethod
+    def _chunk_key(cls, version, index):
+        if version is None:
+            # snapshots saved before chunks were versioned
+            return ndb.Key(cls, u'chunk\t%d' % index)
+        return ndb.Key(cls, u'chunk\t%s\t%d' % (version, index))
+
+
+class TextPosting(ndb.Model):
+    """Entry of full-text inverted index: occurrences of a term in a page.
+
+    `length` is the length of the page as of when its postings were written.
+    """
+    term = ndb.StringProperty()
+    title = ndb.StringProperty()
+    tf = ndb.IntegerProperty()
+    length = ndb.IntegerProperty(indexed=False)
+
+    @classmethod
+    def _key_of(cls, term, title):
+        return ndb.Key(cls, u'%s\t%s' % (term, title))
+
+
+class DataIndexRebuild(ndb.Model):
+    """Progress of the latest rebuild of schema data index, with id "latest" """
+    job_id = ndb.StringProperty()
+    started_at = ndb.DateTimeProperty()
+    finished_at = ndb.DateTimeProperty()
+    num_pages = ndb.IntegerProperty(default=0)
+    num_shards = ndb.IntegerProperty(default=0)
+    processed_pages = ndb.IntegerProperty(default=0)
+    finished_shards = ndb.IntegerProperty(default=0)
+
+    @classmethod
+    def start(cls, num_pages, num_shards):
+        """Starts new job, superseding previous one. Returns its id"""
+        now = datetime.now()
+        job = cls(id=u'latest', job_id=now.isoformat(), started_at=now,
+                  num_pages=num_pages, num_shards=num_shards)
+        job.put()
+        return job.job_id
+
+    @classmethod
+    def add_progress(cls, job_id, num_pages, shard_finished):
+        """Returns False if the job is not the latest one"""
+        def txn():
+            job = cls.get_by_id(u'latest')
+            if job is None or job.job_id != job_id:
+                return False
+            job.processed_pages += num_pages
+            if shard_finished:
+                job.finished_shards += 1
+                if job.finished_shards >= job.num_shards:
+                    job.finished_at = datetime.now()
+            job.put()
+            return True
+        return ndb.transaction(txn)
+
+    @property
+    def elapsed(self):
+        return ((self.finished_at or datetime.now()) - self.started_at).total_seconds()
+
+    @property
+    def throughput(self):
+        """Pages processed per second"""
+        return self.processed_pages / self.elapsed if self.elapsed > 0 else 0.0
+
+    def report(self):
+        lines = [
+            u'Job: %s' % self.job_id,
+            u'Pages: %d/%d' % (self.processed_pages, self.num_pages),
+            u'Shards: %d/%d' % (self.finished_shards, self.num_shards),
+            u'Elapsed: %.1fs' % self.elapsed,
+            u'Throughput: %.1f pages/s' % self.throughput,
+        ]
+        if self.finished_at is not None:
+            lines.append(u'Finished!')
+        return u'\n'.join(lines)
+
+
+class TextIndexStats(ndb.Model):
+    num_docs = ndb.IntegerProperty(default=0)
+    total_length = ndb.IntegerProperty(default=0)
+
+
+class TextDocument(ndb.Model):
+    """Indexed terms of a page, keyed by title.
+
+    Postings of terms whose frequency did not change are kept on update, as
+    long as length of the page stays within `max_length_drift` of `length`
+    written in them.
+    """
+    max_length_drift = 0.1
+    max_postings = 1000
+
+    terms = ndb.JsonProperty(compressed=True)
+    length = ndb.IntegerProperty(indexed=False)
+
+    @classmethod
+    def update(cls, title, text):
+        new_terms = fulltext.term_frequencies(text)
+        doc = cls.get_by_id(title)
+        old_terms = doc.terms if doc is not None else {}
+        old_length = doc.length if doc is not None else 0
+
+        new_length = sum(new_terms.values())
+        if doc is None or abs(new_length - old_length) > old_length * cls.max_length_drift:
+            length = new_length
+            changed = new_terms.keys()
+        else:
+            length = old_length
+            changed = [t for t, tf in new_terms.items() if old_terms.get(t) != tf]
+        removed = [t for t in old_terms.keys() if t not in new_terms]
+
+        ndb.put_multi([TextPosting(key=TextPosting._key_of(t, title), term=t, title=title,
+                                   tf=new_terms[t], length=length)
+                       for t in changed])
+        ndb.delete_multi([TextPosting._key_of(t, title) for t in removed])
+
+        if len(new_terms) > 0:
+            cls(id=title, terms=new_terms, length=length).put()
+            cls._update_stats(0 if doc is not None else 1, length - old_length)
+        elif doc is not None:
+            doc.key.delete()
+            cls._update_stats(-1, -old_length)
+
+        if len(changed) > 0 or len(removed) > 0:
+            cache.incr_generations([u'text_index\t%s' % t for t in changed + removed])
+
+    @classmethod
+    def _update_stats(cls, num_docs, total_length):
+        def txn():
+            stats = TextIndexStats.get_by_id(u'stats') or TextIndexStats(id=u'stats')
+            stats.num_docs += num_docs
+            stats.total_length += total_length
+            stats.put()
+        ndb.transaction(txn)
+
+    @classmethod
+    def search(cls, terms):
+        """Returns list of (title, score) matching any of terms, ranked by BM25.
+
+        Only `max_postings` most frequent occurrences of each term are read.
+        Cached result is valid until postings of any of terms change, while
+        drift of document count and average length is ignored until it expires.
+        """
+        generations = cache.get_generations([u'text_index\t%s' % t for t in terms])
+        result = cache.get_text_search(terms, generations)
+        if result is not None:
+            return result
+
+        stats = TextIndexStats.get_by_id(u'stats')
+        if stats is None or stats.num_docs <= 0:
+            return []
+        avg_length = float(stats.total_length) / stats.num_docs
+
+        queries = [TextPosting.query(TextPosting.term == term).order(-TextPosting.tf)
+                   for term in terms]
+        futures = [q.fetch_async(cls.max_postings) for q in queries]
+
+        scores = {}
+        for term, future in zip(terms, futures):
+            postings = future.get_result()
+            df = len(postings)
+            if df == cls.max_postings:
+                df = TextPosting.query(TextPosting.term == term).count()
+            for p in postings:
+                score = fulltext.bm25(p.tf, p.length, df, stats.num_docs, avg_length)
+                scores[p.title] = scores.get(p.title, 0.0) + score
+
+        result = sorted(scores.iteritems(), key=operator.itemgetter(1), reverse=True)
+        cache.set_text_search(terms, generations, result)
+        return result
+
 
 class TocGenerator(object):
     re_headings = ur'<h(\d)>(.+?)</h\d>'
@@ -1496,6 +2770,38 @@ regions = {
 }
 
 
+def compress_redirects(edges):
+    """Collapses redirect chains so that each title maps to its final target.
+
+    Titles in a redirect loop are mapped to themselves, and titles leading to
+    a loop are mapped to the first title of the loop.
+    """
+    resolved = {}
+    for title in edges:
+        path = []
+        cur = title
+        while cur in edges and cur not in resolved and cur not in path:
+            path.append(cur)
+            cur = edges[cur]
+
+        if cur in resolved:
+            target = resolved[cur]
+        elif cur in path:
+            # loop
+            loop_start = path.index(cur)
+            for t in path[loop_start:]:
+                resolved[t] = t
+            path = path[:loop_start]
+            target = cur
+        else:
+            target = cur
+
+        for t in path:
+            resolved[t] = target
+
+    return resolved
+
+
 def title_grouper(title):
     title = title.upper()
     head = title[0]
@@ -1527,7 +2833,7 @@ def is_admin_user(user):
 
 md = markdown.Markdown(
     extensions=[
-        md_wikilink.WikiLinkExtension(),
+        md_wikilink.WikiLinkExtension(title_exists=WikiPage.title_exists),
         md_itemprop.ItemPropExtension(),
         md_url.URLExtension(),
         md_mathjax.MathJaxExtension(),
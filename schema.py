@@ -1,3 +1,7 @@
+import re
+from datetime import date
+
+
 SUPPORTED_SCHEMA = {
     'Article': {
         'parent': 'CreativeWork',
@@ -105,3 +109,58 @@ def get_itemtype_path(itemtype):
         return '/'.join(parts)
     except KeyError:
         raise ValueError('Unsupported schema: %s' % itemtype)
+
+
+# types of property values other than string. values of properties not listed
+# here are also indexed as numbers when they look like one.
+PROPERTY_TYPES = {
+    'birthDate': 'date',
+    'dateModified': 'date',
+    'datePublished': 'date',
+    'deathDate': 'date',
+}
+
+re_date = re.compile(r'^(\d{4})(?:-(\d{1,2})(?:-(\d{1,2}))?)?$')
+
+
+def get_property_type(prop):
+    return PROPERTY_TYPES.get(prop, 'string')
+
+
+def parse_date_period(value):
+    """Returns (start, end) dates of period of value such as 2013, 2013-05 or
+    2013-05-01, or None if it is not a date. end is exclusive."""
+    m = re_date.match(value.strip())
+    if m is None:
+        return None
+    year, month, day = [int(g) if g else None for g in m.groups()]
+    try:
+        if month is None:
+            return date(year, 1, 1), date(year + 1, 1, 1)
+        elif day is None:
+            start = date(year, month, 1)
+            return start, date(year + month // 12, month % 12 + 1, 1)
+        else:
+            start = date(year, month, day)
+            return start, date.fromordinal(start.toordinal() + 1)
+    except (ValueError, OverflowError):
+        return None
+
+
+def parse_number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    # nan and infinities cannot be compared meaningfully
+    if number != number or number in (float('inf'), float('-inf')):
+        return None
+    return number
+
+
+def coerce_value(prop, value):
+    """Returns (date, number) of value of prop, either of which can be None"""
+    if get_property_type(prop) == 'date':
+        period = parse_date_period(value)
+        return period[0] if period is not None else None, None
+    return None, parse_number(value)
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 
 import re
+import heapq
 import operator
-import pyparsing as p
+import threading
 from collections import OrderedDict
 
 
@@ -29,57 +30,232 @@ def parse_expression(exp):
     }
 
 
-def evaluate(positives, negatives):
-    """evaluate related page search expression"""
+def format_expression(positives, negatives):
+    """format related page search expression. inverse of parse_expression()"""
+    return u' '.join([u'+' + t for t in positives] + [u'-' + t for t in negatives])
+
+
+def evaluate(positives, negatives, limit=None):
+    """evaluate related page search expression.
+
+    positives and negatives are dicts of operand title -> its link scoretable.
+    Returns OrderedDict of title -> score in descending order of score, with
+    at most `limit` titles if given.
+    """
+    return sort_scores(calculate_scores(positives, negatives), limit)
+
+
+def calculate_scores(positives, negatives):
+    """Returns unsorted dict of title -> score of related page search
+    expression. Arguments are the same as evaluate()."""
     scoretable = {}
-    keys = positives.keys() + negatives.keys()
-    length = len(keys)
-
-    # calc positives
-    for scores in positives.values():
-        for title, score in scores.items():
-            if title in keys:
-                continue
-            if title not in scoretable:
-                scoretable[title] = 0.0
-            scoretable[title] += score / length
-
-    # calc negatives
-    for scores in negatives.values():
-        for title, score in scores.items():
-            if title in keys:
-                continue
-            if title not in scoretable:
-                scoretable[title] = 0.0
-            scoretable[title] -= score / length
-
-    # descending by score
-    sorted_tuples = sorted(scoretable.iteritems(),
-                           key=operator.itemgetter(1),
-                           reverse=True)
+    operands = set(positives.keys()) | set(negatives.keys())
+    length = len(positives) + len(negatives)
+
+    for sign, scoretables in [(1.0, positives), (-1.0, negatives)]:
+        for scores in scoretables.itervalues():
+            for title, score in scores.iteritems():
+                if title in operands:
+                    continue
+                scoretable[title] = scoretable.get(title, 0.0) + sign * score / length
+    return scoretable
+
+
+def sort_scores(scoretable, limit=None):
+    """Returns OrderedDict of title -> score in descending order of score,
+    with at most `limit` titles if given"""
+    if limit is None:
+        sorted_tuples = sorted(scoretable.iteritems(),
+                               key=operator.itemgetter(1),
+                               reverse=True)
+    else:
+        sorted_tuples = heapq.nlargest(limit, scoretable.iteritems(),
+                                       key=operator.itemgetter(1))
 
     return OrderedDict(sorted_tuples)
 
 
+def split_scores(scoretable, limit):
+    """Returns top `limit` positive and negative scores as two OrderedDicts.
+
+    Negative scores are returned as their absolute values.
+    """
+    positives = heapq.nlargest(limit,
+                               ((k, v) for k, v in scoretable.iteritems() if v >= 0.0),
+                               key=operator.itemgetter(1))
+    negatives = heapq.nlargest(limit,
+                               ((k, -v) for k, v in scoretable.iteritems() if v < 0.0),
+                               key=operator.itemgetter(1))
+    return OrderedDict(positives), OrderedDict(negatives)
+
+
 # Wikiquery grammar
-identifier = p.Regex(r'([a-zA-Z_][.0-9a-zA-Z_]*)')
-double_quote_str = p.dblQuotedString.setParseAction(p.removeQuotes)
+#
+#   query      := expression ['>' attributes]
+#   expression := product ('+' product)*
+#   product    := operand ('*' operand)*
+#   operand    := '(' expression ')' | [identifier ':'] string |
+#                 identifier comparison string
+#   comparison := '>=' | '<=' | '>' | '<' | '^='
+#   attributes := '*' | identifier (',' identifier)*
+#
+# Terms are parsed into [name, value] (name defaults to 'name'), comparisons
+# into [name, comparison, value] and chained operators of the same precedence
+# into a flat list such as [a, '+', b, '+', c].
+re_wikiquery_token = re.compile(r'''[ \t\r\n]*(?:
+    (?P<string>"(?:[^"\n\r\\]|(?:"")|(?:\\x[0-9a-fA-F]+)|(?:\\.))*")|
+    (?P<identifier>[a-zA-Z_][.0-9a-zA-Z_]*)|
+    (?P<op>>=|<=|\^=|[*+():<>,])|
+    (?P<end>\Z))''', re.VERBOSE)
+
+
+class WikiqueryError(ValueError):
+    def __init__(self, message, pos):
+        ValueError.__init__(self, u'%s (at char %d)' % (message, pos))
+        self.pos = pos
+
+
+def tokenize_wikiquery(q):
+    """Returns list of (kind, value, pos) of q ending with ('end', None, len(q))"""
+    tokens = []
+    pos = 0
+    while True:
+        m = re_wikiquery_token.match(q, pos)
+        if m is None:
+            pos = len(q) - len(q[pos:].lstrip(' \t\r\n'))
+            raise WikiqueryError(u'Unexpected character %s' % q[pos], pos)
+        kind = m.lastgroup
+        tokens.append((kind, m.group(kind) if kind != 'end' else None, m.start(kind)))
+        if kind == 'end':
+            return tokens
+        pos = m.end()
+
+
+comparisons = ['>=', '<=', '>', '<', '^=']
+
+
+def is_page_query_term(q):
+    """Returns True if q is a term or comparison rather than an expression"""
+    return isinstance(q[0], basestring)
 
-page_query_expr = p.Forward()
-attr_expr = p.Forward()
 
-expr = page_query_expr + p.Optional(p.Suppress('>') + attr_expr)
-expr.setParseAction(lambda x: x if len(x) == 2 else [x[0], ['name']])
+class _WikiqueryParser(object):
+    token_names = {
+        'string': 'quoted string',
+        'identifier': 'identifier',
+        'end': 'end of query',
+    }
+
+    def __init__(self, q):
+        self.tokens = tokenize_wikiquery(q)
+        self.index = 0
+
+    def peek(self):
+        return self.tokens[self.index]
+
+    def accept(self, op):
+        kind, value, _ = self.tokens[self.index]
+        if kind == 'op' and value == op:
+            self.index += 1
+            return True
+        return False
+
+    def expect(self, kind, op=None):
+        token = self.tokens[self.index]
+        if token[0] != kind or (op is not None and token[1] != op):
+            expected = "'%s'" % op if op is not None else self.token_names[kind]
+            found = self.token_names['end'] if token[0] == 'end' else token[1]
+            raise WikiqueryError(u'Expected %s but found %s' % (expected, found), token[2])
+        self.index += 1
+        return token[1]
+
+    def query(self):
+        expression = self.expression()
+        if self.accept('>'):
+            if self.accept('*'):
+                # every attribute
+                attributes = ['*']
+            else:
+                attributes = [self.expect('identifier')]
+                while self.accept(','):
+                    attributes.append(self.expect('identifier'))
+        else:
+            attributes = ['name']
+        self.expect('end')
+        return [expression, attributes]
+
+    def expression(self):
+        return self._chain(self.product, '+')
+
+    def product(self):
+        return self._chain(self.operand, '*')
+
+    def _chain(self, parse_operand, op):
+        result = [parse_operand()]
+        while self.accept(op):
+            result += [op, parse_operand()]
+        return result[0] if len(result) == 1 else result
 
-page_query_term = p.Group(p.Optional(identifier + p.Suppress(':')) + double_quote_str)
-page_query_term.setParseAction(lambda x: x if len(x[0]) == 2 else [['name', x[0][0]]])
-page_query_expr << p.operatorPrecedence(page_query_term, [
-    (p.Literal('*'), 2, p.opAssoc.LEFT),
-    (p.Literal('+'), 2, p.opAssoc.LEFT),
-])
+    def operand(self):
+        if self.accept('('):
+            expression = self.expression()
+            self.expect('op', ')')
+            return expression
+        name = 'name'
+        if self.peek()[0] == 'identifier':
+            name = self.expect('identifier')
+            kind, op, _ = self.peek()
+            if kind == 'op' and op in comparisons:
+                self.index += 1
+                return [name, op, self.expect('string')[1:-1]]
+            self.expect('op', ':')
+        return [name, self.expect('string')[1:-1]]
 
-attr_expr << p.Group(p.delimitedList(identifier))
+
+class LRUCache(object):
+    """Mapping of bounded size which evicts least recently used entries"""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            value = self._entries.pop(key)
+            self._entries[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# parsed wikiqueries shared by requests on this instance
+parsed_wikiqueries = LRUCache(1000)
 
 
 def parse_wikiquery(q):
-    return expr.parseString(q).asList()
+    parsed = parsed_wikiqueries.get(q)
+    if parsed is None:
+        parsed = _WikiqueryParser(q).query()
+        parsed_wikiqueries.set(q, parsed)
+    # callers get their own copy
+    return _copy_list(parsed)
+
+
+def _copy_list(value):
+    if type(value) == list:
+        return [_copy_list(v) for v in value]
+    return value
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import fulltext
+import unittest2 as unittest
+
+
+class TokenizerTest(unittest.TestCase):
+    def test_english(self):
+        self.assertEqual([(u'hello', 0, 5), (u'world', 7, 12)],
+                         fulltext.tokenize(u'Hello, World!'))
+
+    def test_korean_bigrams(self):
+        self.assertEqual([u'한국', u'국어', u'문서'],
+                         [t for t, _, _ in fulltext.tokenize(u'한국어 문서')])
+
+    def test_single_syllable(self):
+        self.assertEqual([u'책'], [t for t, _, _ in fulltext.tokenize(u'책')])
+
+    def test_mixed(self):
+        self.assertEqual([u'python', u'으로', u'위키'],
+                         [t for t, _, _ in fulltext.tokenize(u'Python으로 위키')])
+
+    def test_term_frequencies(self):
+        self.assertEqual({u'a': 2, u'b': 1}, fulltext.term_frequencies(u'a b a'))
+
+
+class BM25Test(unittest.TestCase):
+    def test_rare_terms_score_higher(self):
+        rare = fulltext.bm25(1, 100, 1, 1000, 100)
+        common = fulltext.bm25(1, 100, 500, 1000, 100)
+        self.assertTrue(rare > common)
+
+    def test_shorter_documents_score_higher(self):
+        short = fulltext.bm25(1, 50, 10, 1000, 100)
+        long = fulltext.bm25(1, 200, 10, 1000, 100)
+        self.assertTrue(short > long)
+
+    def test_tf_saturates(self):
+        self.assertTrue(fulltext.bm25(100, 100, 10, 1000, 100) < 2.2 * fulltext.bm25(1, 100, 10, 1000, 100))
+
+
+class SnippetTest(unittest.TestCase):
+    def test_snippet(self):
+        text = u'x ' * 100 + u'hello world'
+        snippet, highlights = fulltext.snippet(text, [u'world'], width=20)
+        self.assertEqual(1, len(highlights))
+        start, end = highlights[0]
+        self.assertEqual(u'world', snippet[start:end])
+
+    def test_overlapping_bigrams_are_merged(self):
+        snippet, highlights = fulltext.snippet(u'가 한국어 문서', [u'한국', u'국어'])
+        self.assertEqual([(2, 5)], highlights)
+        self.assertEqual(u'한국어', snippet[2:5])
+
+    def test_no_match(self):
+        self.assertEqual((u'hello', []), fulltext.snippet(u'hello', [u'world']))
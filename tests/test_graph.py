@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import unittest2 as unittest
+from graph import LinkGraph, personalized_pagerank, related_nodes, local_push, link_similarity
+
+
+class LinkGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = LinkGraph.from_links({
+            u'A': {u'Article/relatedTo': [u'B', u'C'], u'Article/author': [u'D']},
+            u'B': {u'Article/relatedTo': [u'C', u'C']},
+            u'C': {u'Article/relatedTo': [u'A']},
+        })
+
+    def titles(self, nodes):
+        return [self.graph.titles[i] for i in nodes]
+
+    def test_nodes(self):
+        self.assertEqual([u'A', u'B', u'C', u'D'], self.graph.titles)
+        self.assertEqual(5, self.graph.num_links)
+
+    def test_outlinks(self):
+        g = self.graph
+        self.assertEqual([u'B', u'C', u'D'], self.titles(g.outlinks(g.ids[u'A'])))
+        self.assertEqual([u'C'], self.titles(g.outlinks(g.ids[u'B'])))
+        self.assertEqual([], self.titles(g.outlinks(g.ids[u'D'])))
+        self.assertEqual(3, g.outdegree(g.ids[u'A']))
+
+    def test_rels(self):
+        g = self.graph
+        a = g.ids[u'A']
+        rels = [g.rel_names[g.rels[i]] for i in range(g.offsets[a], g.offsets[a + 1])]
+        self.assertEqual([u'Article/relatedTo', u'Article/relatedTo', u'Article/author'], rels)
+
+    def test_transpose(self):
+        t = self.graph.transpose()
+        self.assertEqual([u'A', u'B'], self.titles(t.outlinks(t.ids[u'C'])))
+        self.assertEqual([u'A'], self.titles(t.outlinks(t.ids[u'D'])))
+        self.assertEqual(self.graph.num_links, t.num_links)
+
+    def test_dumps_and_loads(self):
+        g = LinkGraph.loads(self.graph.dumps())
+        self.assertEqual(self.graph.titles, g.titles)
+        self.assertEqual(self.graph.rel_names, g.rel_names)
+        self.assertEqual(list(self.graph.offsets), list(g.offsets))
+        self.assertEqual(list(self.graph.targets), list(g.targets))
+        self.assertEqual(list(self.graph.rels), list(g.rels))
+
+    def test_unicode_titles(self):
+        g = LinkGraph.loads(LinkGraph.from_links({u'가': {u'Article/relatedTo': [u'나']}}).dumps())
+        self.assertEqual([u'나'], [g.titles[i] for i in g.outlinks(g.ids[u'가'])])
+
+
+class PersonalizedPageRankTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = LinkGraph.from_links({
+            u'A': {u'Article/relatedTo': [u'B', u'C']},
+            u'B': {u'Article/relatedTo': [u'D']},
+            u'C': {u'Article/relatedTo': [u'D']},
+            u'D': {u'Article/relatedTo': [u'E']},
+            u'X': {u'Article/relatedTo': [u'A']},
+        })
+
+    def test_scores_sum_to_one(self):
+        scores = personalized_pagerank(self.graph, self.graph.ids[u'A'],
+                                       max_iterations=200, epsilon=0.0)
+        self.assertAlmostEqual(1.0, sum(scores.values()), places=6)
+
+    def test_unreachable_nodes(self):
+        scores = personalized_pagerank(self.graph, self.graph.ids[u'A'])
+        self.assertFalse(self.graph.ids[u'X'] in scores)
+
+    def test_related_nodes(self):
+        g = self.graph
+        related = related_nodes(g, g.ids[u'A'])
+        titles = [g.titles[node] for node, _ in related]
+
+        # D is reached through both B and C
+        self.assertEqual(u'D', titles[0])
+        self.assertEqual(set([u'B', u'C']), set(titles[2:]))
+        self.assertEqual(related[2][1], related[3][1])
+        self.assertFalse(u'A' in titles)
+
+    def test_limit(self):
+        g = self.graph
+        self.assertEqual(2, len(related_nodes(g, g.ids[u'A'], limit=2)))
+
+
+class LocalPushTest(unittest.TestCase):
+    def setUp(self):
+        self.links = {
+            u'A': [u'B', u'C'],
+            u'B': [u'D'],
+            u'C': [u'D', u'A'],
+            u'D': [u'E'],
+            u'E': [],
+            u'X': [u'A'],
+        }
+        self.graph = LinkGraph.from_links(
+            dict((k, {u'Article/relatedTo': v}) for k, v in self.links.items()))
+
+    def test_approximates_pagerank(self):
+        g = self.graph
+        expected = personalized_pagerank(g, g.ids[u'A'], max_iterations=200, epsilon=0.0)
+        actual = local_push(lambda title: self.links[title], u'A', epsilon=1e-6)
+        for node, score in expected.items():
+            self.assertAlmostEqual(score, actual.get(g.titles[node], 0.0), places=3)
+
+    def test_bounded_work(self):
+        visited = []
+
+        def outlinks_of(title):
+            visited.append(title)
+            return self.links[title]
+
+        local_push(outlinks_of, u'A', epsilon=0.2)
+        self.assertFalse(u'X' in visited)
+        self.assertTrue(len(visited) <= 5)
+
+    def test_max_pushes(self):
+        scores = local_push(lambda title: self.links[title], u'A', max_pushes=1)
+        self.assertEqual([u'A'], scores.keys())
+
+
+class LinkSimilarityTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = LinkGraph.from_links({
+            u'X': {u'Article/relatedTo': [u'A', u'B']},
+            u'Y': {u'Article/relatedTo': [u'A', u'B', u'C']},
+            u'Z': {u'Article/author': [u'C']},
+        })
+
+    def similar(self, title, **kwargs):
+        g = self.graph
+        return [(g.titles[node], score)
+                for node, score in link_similarity(g, g.ids[title], **kwargs)]
+
+    def test_cocitation(self):
+        similar = self.similar(u'A', mode='cocitation')
+        self.assertEqual([u'B', u'C'], [title for title, _ in similar])
+        self.assertAlmostEqual(1.0, similar[0][1])
+        self.assertAlmostEqual(0.5, similar[1][1])
+
+    def test_coupling(self):
+        similar = self.similar(u'X', mode='coupling')
+        self.assertEqual([u'Y'], [title for title, _ in similar])
+        self.assertAlmostEqual(2 / 6 ** 0.5, similar[0][1])
+
+    def test_both(self):
+        self.assertEqual([u'B', u'C'], [title for title, _ in self.similar(u'A')])
+        self.assertEqual([(u'Y', 1 / 6 ** 0.5)], self.similar(u'X'))
+
+    def test_hubs_are_skipped(self):
+        self.assertEqual([u'B'], [title for title, _ in self.similar(u'A', mode='cocitation', max_degree=2)])
+
+    def test_ties_are_ordered(self):
+        g = LinkGraph.from_links({u'X': {u'Article/relatedTo': [u'C', u'A', u'B']}})
+        similar = link_similarity(g, g.ids[u'A'], mode='cocitation')
+        self.assertEqual([u'B', u'C'], [g.titles[node] for node, _ in similar])
@@ -180,6 +180,32 @@ class PageHandlerTest(unittest.TestCase):
         self.assertEqual('http://localhost/Hello_World',
                          self.browser.res.location)
 
+    def test_redirect_to_canonical_title(self):
+        self.browser.get('/HOME', follow_redir=False)
+        self.assertEqual(303, self.browser.res.status_code)
+        self.assertEqual('http://localhost/Home', self.browser.res.location)
+
+        self.browser.get('/post_a?rev=list', follow_redir=False)
+        self.assertEqual('http://localhost/Post_A?rev=list', self.browser.res.location)
+
+    def test_nfd_title(self):
+        page = WikiPage.get_by_title(u'\uc11c\uac00')
+        page.update_content(u'Hello', 0)
+
+        # NFD form of the same title
+        self.browser.get('/%E1%84%89%E1%85%A5%E1%84%80%E1%85%A1', follow_redir=False)
+        self.assertEqual(303, self.browser.res.status_code)
+        self.assertEqual('http://localhost/%EC%84%9C%EA%B0%80', self.browser.res.location)
+
+    def test_no_redirect_for_missing_page(self):
+        self.browser.get('/Nothing', follow_redir=False)
+        self.assertEqual(404, self.browser.res.status_code)
+
+    def test_invalid_wikiquery(self):
+        self.browser.get('/="Home" >')
+        self.assertEqual(400, self.browser.res.status_code)
+        self.assertIn('at char', self.browser.res.body)
+
     def test_delete_page_without_permission(self):
         self.browser.login('ak@gmail.com', 'ak', is_admin=False)
         self.browser.post('/New_page?_method=PUT', 'body=[[Link!]]&revision=0')
@@ -221,6 +247,16 @@ class RevisionTest(unittest.TestCase):
         self.browser.get('/A?view=bodyonly&rev=1')
         self.assertEqual(200, self.browser.res.status_code)
 
+    def test_inlinks_should_ignore_rev(self):
+        WikiPage.get_by_title(u'B').update_content(u'[[A]]', 0)
+        page = WikiPage.get_by_title(u'A')
+        page.update_content(u'Hello', 0)
+        page.update_content(u'Hello there', 1)
+
+        self.browser.get('/A?view=inlinks&rel=Article/relatedTo&_type=json&rev=1')
+        self.assertEqual(200, self.browser.res.status_code)
+        self.assertEqual([u'B'], json.loads(self.browser.res.body)['titles'])
+
     def test_rev_param(self):
         page = WikiPage.get_by_title(u'A')
         page.update_content(u'Hello', 0)
@@ -302,6 +338,8 @@ class HTML5ValidationTest(unittest.TestCase):
             self._validate('/sp.index?_type=atom', 'xml')
 
             self._validate('/sp.search?_type=json&view=opensearch', 'json')
+            self._validate('/sp.text_search?q=Home', 'html')
+            self._validate('/sp.text_search?q=Home&_type=json', 'json')
 
             self._validate('/="Home"', 'html')
             self._validate('/="Home"?view=bodyonly', 'html')
@@ -312,8 +350,9 @@ class HTML5ValidationTest(unittest.TestCase):
             self._validate('/sp.posts', 'html')
             self._validate('/sp.posts?_type=atom', 'xml')
 
+            self._validate('/sp.update_stale_related_pages', 'text')
+            self._validate('/sp.data_index_progress', 'text')
             self._validate('/sp.randomly_update_related_pages', 'text')
-            self._validate('/sp.randomly_update_related_pages?recent=1', 'text')
 
         self.browser.login('user@example.com', 'ak', is_admin=False)
         validate()
@@ -2,11 +2,17 @@
 import os
 import main
 import cache
+import search
+import titleindex
 import unittest2 as unittest
 from itertools import groupby
 from google.appengine.api import users
+from google.appengine.api import memcache
+from google.appengine.api import datastore
+from google.appengine.ext import ndb
 from google.appengine.ext import testbed
-from models import md, WikiPage, UserPreferences, title_grouper, ConflictError
+from models import md, WikiPage, UserPreferences, LinkGraphSnapshot, Backlink, title_grouper, compress_redirects, \
+    ConflictError
 from markdownext.md_wikilink import parse_wikilinks
 
 
@@ -430,6 +436,122 @@ class WikiPageRelatedPageUpdatingTest(unittest.TestCase):
         for _ in range(10):
             a.update_related_links()
 
+    def test_update_all_related_links(self):
+        WikiPage.get_by_title(u'A').update_content(u'[[B]], [[C]]', 0)
+        WikiPage.get_by_title(u'B').update_content(u'[[D]]', 0)
+        WikiPage.get_by_title(u'C').update_content(u'[[D]], [[E]]', 0)
+        WikiPage.get_by_title(u'D').update_content(u'Hello', 0)
+
+        # shards are [A, C) and [C, ...)
+        WikiPage.update_all_related_links(num_shards=2)
+        WikiPage._update_related_links_shard(u'A', u'C')
+        WikiPage._update_related_links_shard(u'C', None)
+
+        a = WikiPage.get_by_title(u'A')
+        self.assertEqual(set([u'D', u'E']), set(a.related_links.keys()))
+        self.assertTrue(a.related_links[u'D'] > a.related_links[u'E'])
+
+    def test_update_all_related_links_should_skip_unchanged_pages(self):
+        WikiPage.get_by_title(u'A').update_content(u'[[B]], [[C]]', 0)
+        WikiPage.get_by_title(u'B').update_content(u'[[D]]', 0)
+        WikiPage.get_by_title(u'C').update_content(u'[[D]], [[E]]', 0)
+        WikiPage.update_all_related_links(num_shards=1)
+        WikiPage._update_related_links_shard(u'A', None)
+        updated_at = WikiPage.get_by_title(u'A').related_links_updated_at
+
+        WikiPage.update_all_related_links(num_shards=1)
+        WikiPage._update_related_links_shard(u'A', None)
+        self.assertEqual(updated_at, WikiPage.get_by_title(u'A').related_links_updated_at)
+
+    def test_update_all_related_links_should_keep_concurrent_edits(self):
+        WikiPage.get_by_title(u'A').update_content(u'[[B]], [[C]]', 0)
+        WikiPage.get_by_title(u'B').update_content(u'[[C]]', 0)
+        WikiPage.get_by_title(u'C').update_content(u'[[D]]', 0)
+        WikiPage.update_all_related_links(num_shards=1)
+
+        related_scores = WikiPage._related_scores
+
+        def edit_and_score(page, *args):
+            if page.title == u'A':
+                WikiPage.get_by_title(u'A').update_content(u'[[B]], [[C]], [[D]]', 1)
+            return related_scores(page, *args)
+
+        WikiPage._related_scores = edit_and_score
+        try:
+            WikiPage._update_related_links_shard(u'A', None)
+        finally:
+            WikiPage._related_scores = related_scores
+
+        a = WikiPage.get_by_title(u'A')
+        self.assertEqual(u'[[B]], [[C]], [[D]]', a.body)
+        self.assertEqual(2, a.revision)
+        self.assertIsNotNone(a.related_links_updated_at)
+
+    def test_update_related_links_locally(self):
+        WikiPage.get_by_title(u'A').update_content(u'[[B]]', 0)
+        WikiPage.get_by_title(u'B').update_content(u'[[C]]', 0)
+        WikiPage.get_by_title(u'C').update_content(u'Hello', 0)
+
+        a = WikiPage.get_by_title(u'A')
+        a.update_related_links_locally()
+        self.assertEqual([u'C'], a.related_links.keys())
+
+        c = WikiPage.get_by_title(u'C')
+        self.assertTrue(u'A' in c.related_links)
+
+        # C is no longer reachable from A
+        a.update_content(u'Hello', 1)
+        WikiPage.get_by_title(u'A').update_related_links_locally()
+        self.assertEqual({}, WikiPage.get_by_title(u'A').related_links)
+        self.assertFalse(u'A' in WikiPage.get_by_title(u'C').related_links)
+
+    def test_related_scores_by_link_similarity(self):
+        WikiPage.get_by_title(u'X').update_content(u'[[A]] [[B]]', 0)
+        WikiPage.get_by_title(u'Y').update_content(u'[[A]] [[B]] [[C]]', 0)
+        link_graph = WikiPage.build_link_graph()
+
+        a = WikiPage.get_by_title(u'A')
+        scores = a._related_scores(link_graph, 'cocitation')
+        self.assertEqual([u'B', u'C'], sorted(scores.keys()))
+        self.assertTrue(scores[u'B'] > scores[u'C'])
+
+        x = WikiPage.get_by_title(u'X')
+        self.assertEqual([u'Y'], x._related_scores(link_graph, 'coupling').keys())
+
+    def test_update_stale_related_links(self):
+        WikiPage.get_by_title(u'A').update_content(u'[[B]]', 0)
+        WikiPage.get_by_title(u'B').update_content(u'[[C]]', 0)
+        WikiPage.get_by_title(u'C').update_content(u'Hello', 0)
+
+        # never updated pages come first. placeholders are never picked
+        self.assertEqual(3, len(WikiPage.update_stale_related_links(10)))
+        self.assertEqual([u'C'], WikiPage.get_by_title(u'A').related_links.keys())
+        self.assertEqual(0, WikiPage.get_by_title(u'A').related_links_churn)
+
+        # edited and relinked pages come before untouched ones
+        b = WikiPage.get_by_title(u'B')
+        b.update_content(u'[[C]] [[D]]', 1)
+        self.assertEqual([u'B'], WikiPage.update_stale_related_links(1))
+
+    def test_add_related_links_views(self):
+        a = WikiPage.get_by_title(u'A')
+        a.update_content(u'Hello', 0)
+        WikiPage.add_related_links_views(u'A')
+        WikiPage.add_related_links_views(u'A')
+
+        a = WikiPage.get_by_title(u'A')
+        self.assertEqual(3, a.related_links_churn)
+        self.assertEqual(u'Hello', a.body)
+
+    def test_related_links_due_at(self):
+        page = WikiPage.get_by_title(u'A')
+        page.update_content(u'Hello', 0)
+        page._set_related_links_updated()
+        due_at = page.related_links_due_at
+
+        page.add_related_links_churn()
+        self.assertTrue(page.related_links_due_at < due_at)
+
     def test_redirect(self):
         a = WikiPage.get_by_title(u'A')
         a.update_content(u'[[B]]', 0)
@@ -492,6 +614,32 @@ class WikiPageSimilarTitlesTest(unittest.TestCase):
         for t in titles:
             self.assertEqual(u'hellothere', WikiPage._normalize_title(t))
 
+    def test_similar_titles_by_chosung(self):
+        index = titleindex.ChosungIndex([u'서가', u'책 서가', u'서가 목록', u'사람'])
+        actual = WikiPage._similar_titles_by_chosung(index, u'ㅅㄱ')
+        expected = {
+            u'startswiths': [u'서가', u'서가 목록'],
+            u'endswiths': [u'책 서가'],
+            u'contains': [],
+        }
+        self.assertEqual(expected, actual)
+
+    def test_complete_titles_by_chosung(self):
+        cache._instance_cache.clear()
+        for title in [u'서가', u'책 서가', u'사람']:
+            WikiPage.get_by_title(title).update_content(u'Hello', 0)
+        self.assertEqual([u'서가', u'책 서가'], WikiPage.complete_titles(u'ㅅㄱ'))
+        self.assertEqual([u'서가'], WikiPage.complete_titles(u'서'))
+
+    def test_suggestions(self):
+        cache._instance_cache.clear()
+        for title in [u'Python', u'Jython', u'Ruby']:
+            WikiPage.get_by_title(title).update_content(u'Hello', 0)
+
+        page = WikiPage.get_by_title(u'Pyhton')
+        self.assertEqual([u'Python', u'Jython'], page.get_similar_titles(None)[u'suggestions'])
+        self.assertEqual([u'Python', u'Jython'], WikiPage.complete_titles(u'Pyhton'))
+
 
 class WikiPageDescriptionTest(unittest.TestCase):
     def setUp(self):
@@ -799,6 +947,532 @@ class WikiPageLinksTest(unittest.TestCase):
         self.assertEqual({}, page.outlinks)
 
 
+class WikiPageInlinksPaginationTest(unittest.TestCase):
+    def setUp(self):
+        cache.prc.flush_all()
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+
+        for i in range(5):
+            WikiPage.get_by_title(u'S%d' % i).update_content(u'[[Hub]]', 0)
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def test_paginate_inlinks(self):
+        hub = WikiPage.get_by_title(u'Hub')
+        titles, cursor = hub.get_inlinks_page(u'Article/relatedTo', limit=3)
+        self.assertEqual([u'S0', u'S1', u'S2'], titles)
+        titles, cursor = hub.get_inlinks_page(u'Article/relatedTo', cursor, limit=3)
+        self.assertEqual([u'S3', u'S4'], titles)
+        self.assertIsNone(cursor)
+
+    def test_legacy_backlinks_should_be_backfilled(self):
+        ndb.delete_multi(Backlink.query().fetch(keys_only=True))
+        WikiPage.get_by_title(u'S5').update_content(u'[[Hub]]', 0)
+
+        hub = WikiPage.get_by_title(u'Hub')
+        titles, _ = hub.get_inlinks_page(u'Article/relatedTo')
+        self.assertEqual([u'S0', u'S1', u'S2', u'S3', u'S4', u'S5'], titles)
+
+    def test_removed_link_should_be_removed_from_store(self):
+        WikiPage.get_by_title(u'S0').update_content(u'Hello', 1)
+        hub = WikiPage.get_by_title(u'Hub')
+        titles, _ = hub.get_inlinks_page(u'Article/relatedTo')
+        self.assertEqual([u'S1', u'S2', u'S3', u'S4'], titles)
+
+    def test_rendered_inlinks_should_be_capped(self):
+        limit = WikiPage.max_inlinks_per_rel
+        WikiPage.max_inlinks_per_rel = 2
+        try:
+            hub = WikiPage.get_by_title(u'Hub')
+            html = hub.rendered_body
+            self.assertEqual(2, html.count(u'class="wikipage"'))
+            self.assertTrue(u'See all 5 pages' in html)
+            self.assertTrue(u'/Hub?view=inlinks&amp;rel=Article/relatedTo' in html)
+        finally:
+            WikiPage.max_inlinks_per_rel = limit
+
+
+class WikiPageLinkCountTest(unittest.TestCase):
+    def setUp(self):
+        cache.prc.flush_all()
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+
+        WikiPage.get_by_title(u'A').update_content(u'[[B]] [[C]] [[author::D]]', 0)
+        WikiPage.get_by_title(u'B').update_content(u'[[C]]', 0)
+        WikiPage.get_by_title(u'C').update_content(u'[[author::A]]', 0)
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def test_counts(self):
+        a = WikiPage.get_by_title(u'A')
+        c = WikiPage.get_by_title(u'C')
+        self.assertEqual(3, a.outlink_count)
+        self.assertEqual(1, a.inlink_count)
+        self.assertEqual({u'Article/author': 1}, a.inlink_counts)
+        self.assertEqual(2, c.inlink_count)
+        self.assertEqual(1, c.edit_count)
+
+    def test_most_linked(self):
+        self.assertEqual([(u'C', 2), (u'A', 1), (u'B', 1)],
+                         WikiPage.get_most_linked(3))
+
+    def test_removing_link_should_decrease_count(self):
+        WikiPage.get_by_title(u'B').update_content(u'Hello', 1)
+        self.assertEqual(1, WikiPage.get_by_title(u'C').inlink_count)
+
+
+class WikiPageLinkGraphTest(unittest.TestCase):
+    def setUp(self):
+        cache.prc.flush_all()
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+
+        WikiPage.get_by_title(u'A').update_content(u'[[B]] [[C]]', 0)
+        WikiPage.get_by_title(u'B').update_content(u'[[C]]', 0)
+        WikiPage.get_by_title(u'D').update_content(u'.read a@x.com\n[[A]]', 0)
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def test_no_snapshot(self):
+        self.assertIsNone(WikiPage.get_link_graph())
+
+    def test_build_and_load(self):
+        WikiPage.build_link_graph()
+        cache.prc.flush_all()
+
+        g = WikiPage.get_link_graph()
+        self.assertEqual([u'A', u'B', u'C', u'D'], g.titles)
+        self.assertEqual([g.ids[u'B'], g.ids[u'C']], list(g.outlinks(g.ids[u'A'])))
+        self.assertEqual([], list(g.outlinks(g.ids[u'D'])))
+
+    def test_chunks(self):
+        chunk_size = LinkGraphSnapshot.chunk_size
+        LinkGraphSnapshot.chunk_size = 10
+        try:
+            WikiPage.build_link_graph()
+            self.assertEqual(3, LinkGraphSnapshot.load().num_links)
+        finally:
+            LinkGraphSnapshot.chunk_size = chunk_size
+
+    def test_chunks_of_old_versions_should_be_deleted(self):
+        for _ in range(3):
+            WikiPage.build_link_graph()
+        head = LinkGraphSnapshot.get_by_id(u'head')
+        self.assertEqual(2, len([k for k in LinkGraphSnapshot.query().fetch(keys_only=True) if k.id() != u'head']))
+        self.assertEqual(3, LinkGraphSnapshot.load().num_links)
+        self.assertNotEqual(head.version, head.prev_version)
+
+    def test_corrupt_chunk_should_not_be_loaded(self):
+        WikiPage.build_link_graph()
+        head = LinkGraphSnapshot.get_by_id(u'head')
+        LinkGraphSnapshot(key=LinkGraphSnapshot._chunk_key(head.version, 0), data='corrupt').put()
+        self.assertEqual(None, LinkGraphSnapshot.load())
+
+
+class WikiPageSweepTest(unittest.TestCase):
+    def setUp(self):
+        cache.prc.flush_all()
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+
+        WikiPage.get_by_title(u'A').update_content(u'[[B]]', 0)
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def test_remove_orphaned_placeholder(self):
+        WikiPage(parent=WikiPage._key(), title=u'X', body=u'', revision=0,
+                 inlinks={}, outlinks={}, related_links={}).put()
+
+        report, cursor = WikiPage.sweep()
+        self.assertEqual([u'X'], report['placeholders'])
+        self.assertIsNone(cursor)
+        self.assertIsNone(WikiPage.query(WikiPage.title == u'X').get())
+
+    def test_remove_dangling_inlink(self):
+        b = WikiPage.get_by_title(u'B')
+        b.add_inlink(u'C', u'Article/relatedTo')
+        b.put()
+
+        report, _ = WikiPage.sweep()
+        self.assertEqual([u'B <- C'], report['inlinks'])
+        self.assertEqual({u'Article/relatedTo': [u'A']}, WikiPage.get_by_title(u'B').inlinks)
+
+    def test_restore_missing_inlink(self):
+        b = WikiPage.get_by_title(u'B')
+        b.inlinks = {}
+        b.put()
+
+        report, _ = WikiPage.sweep()
+        self.assertEqual([u'A -> B'], report['outlinks'])
+        self.assertEqual({u'Article/relatedTo': [u'A']}, WikiPage.get_by_title(u'B').inlinks)
+
+    def test_index_redirect_of_legacy_page(self):
+        WikiPage.get_by_title(u'X').update_content(u'.redirect A', 0)
+
+        # as saved before WikiPage.redirect existed
+        entity = datastore.Get(WikiPage.get_by_title(u'X').key.to_old_key())
+        del entity['redirect']
+        datastore.Put(entity)
+        cache.del_redirects()
+        self.assertEqual({}, WikiPage.get_redirect_map())
+
+        report, _ = WikiPage.sweep()
+        self.assertEqual([u'X -> A'], report['redirects'])
+        self.assertEqual({u'X': u'A'}, WikiPage.get_redirect_map())
+
+    def test_store_computed_properties_of_legacy_page(self):
+        WikiPage.get_by_title(u'Hello').update_content(u'[[A]]', 0)
+
+        # as saved before WikiPage.folded_title and link counts existed
+        entity = datastore.Get(WikiPage.get_by_title(u'Hello').key.to_old_key())
+        for name in ['folded_title', 'inlink_count', 'outlink_count', 'related_links_due_at',
+                     'stored_properties_version']:
+            del entity[name]
+        datastore.Put(entity)
+        self.assertIsNone(WikiPage.get_canonical_title(u'HELLO'))
+
+        report, _ = WikiPage.sweep()
+        self.assertEqual([u'Hello'], report['properties'])
+        self.assertEqual(u'Hello', WikiPage.get_canonical_title(u'HELLO'))
+        self.assertIn(u'Hello', [page.title for page in WikiPage.query(WikiPage.outlink_count == 1).fetch()])
+
+        report, _ = WikiPage.sweep()
+        self.assertEqual([], report['properties'])
+
+    def test_resume_with_cursor(self):
+        WikiPage.get_by_title(u'C').update_content(u'Hello', 0)
+
+        report, cursor = WikiPage.sweep(batch_size=2)
+        self.assertEqual(2, report['pages'])
+        report, cursor = WikiPage.sweep(cursor, batch_size=2)
+        self.assertEqual(1, report['pages'])
+        self.assertIsNone(cursor)
+
+
+class WikiPageTitleFilterTest(unittest.TestCase):
+    def setUp(self):
+        cache.prc.flush_all()
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+        self.testbed.init_user_stub()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def test_missing_link(self):
+        WikiPage.get_by_title(u'A').update_content(u'[[B]] [[C]]', 0)
+        WikiPage.get_by_title(u'B').update_content(u'Hello', 0)
+        html = WikiPage.get_by_title(u'A').rendered_body
+        self.assertTrue(u'<a class="wikipage" href="/B">B</a>' in html)
+        self.assertTrue(u'<a class="wikipage missing" href="/C">C</a>' in html)
+
+    def test_creating_page_should_update_links(self):
+        WikiPage.get_by_title(u'A').update_content(u'[[B]]', 0)
+        self.assertTrue(u'wikipage missing' in WikiPage.get_by_title(u'A').rendered_body)
+
+        WikiPage.get_by_title(u'B').update_content(u'Hello', 0)
+        self.assertFalse(u'wikipage missing' in WikiPage.get_by_title(u'A').rendered_body)
+
+    def test_deleting_page_should_update_links(self):
+        os.environ['USER_EMAIL'] = 'a@x.com'
+        os.environ['USER_ID'] = 'a'
+        os.environ['USER_IS_ADMIN'] = '1'
+
+        WikiPage.get_by_title(u'A').update_content(u'[[B]]', 0)
+        WikiPage.get_by_title(u'B').update_content(u'Hello', 0)
+        self.assertFalse(u'wikipage missing' in WikiPage.get_by_title(u'A').rendered_body)
+
+        WikiPage.get_by_title(u'B').delete(users.get_current_user())
+        self.assertTrue(u'wikipage missing' in WikiPage.get_by_title(u'A').rendered_body)
+
+    def test_concurrent_updates_should_not_lose_titles(self):
+        WikiPage.get_by_title(u'A').update_content(u'Hello', 0)
+        WikiPage.get_title_filter()
+
+        def update(title_filter):
+            if not concurrent:
+                # another request adds B in the meantime
+                concurrent.append(True)
+                other = memcache.get('model\ttitle_filter')
+                other.add(u'B')
+                memcache.set('model\ttitle_filter', other)
+            title_filter.add(u'C')
+            return True
+
+        concurrent = []
+        self.assertTrue(cache.update_title_filter(update))
+        title_filter = memcache.get('model\ttitle_filter')
+        self.assertTrue(u'B' in title_filter)
+        self.assertTrue(u'C' in title_filter)
+
+
+class WikiPageSearchTest(unittest.TestCase):
+    def setUp(self):
+        cache.prc.flush_all()
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def test_search(self):
+        WikiPage.get_by_title(u'A').update_content(u'[[B]] [[C]]', 0)
+        WikiPage.get_by_title(u'D').update_content(u'[[C]]', 0)
+        self.assertEqual([u'B'], WikiPage.search(u'+A -D').keys()[:1])
+
+        scores = WikiPage.search_scores(u'+A -D')
+        self.assertEqual([u'B'], search.split_scores(scores, 20)[0].keys()[:1])
+
+    def test_cached_link_scoretable(self):
+        WikiPage.get_by_title(u'A').update_content(u'[[B]]', 0)
+        self.assertEqual([u'B'], WikiPage.get_by_title(u'A').link_scoretable.keys())
+        self.assertEqual([(u'B', 1.0)], cache.get_link_scoretable(u'A'))
+
+        WikiPage.get_by_title(u'C').update_content(u'[[A]]', 0)
+        self.assertEqual(None, cache.get_link_scoretable(u'A'))
+
+    def test_cached_result_is_invalidated_by_link_change(self):
+        WikiPage.get_by_title(u'A').update_content(u'[[B]]', 0)
+        self.assertEqual([u'B'], WikiPage.search(u'+A').keys())
+        self.assertEqual([u'B'], WikiPage.search(u'+A +A').keys())
+
+        WikiPage.get_by_title(u'A').update_content(u'[[B]] [[C]]', 1)
+        self.assertEqual(set([u'B', u'C']), set(WikiPage.search(u'+A').keys()))
+
+
+class WikiPageTextSearchTest(unittest.TestCase):
+    def setUp(self):
+        cache.prc.flush_all()
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def update(self, title, body):
+        page = WikiPage.get_by_title(title)
+        page.update_content(body, page.revision)
+        WikiPage._update_text_index_deferred(title)
+
+    def titles(self, q, user=None):
+        return [r['title'] for r in WikiPage.text_search(q, user)]
+
+    def test_search(self):
+        self.update(u'A', u'The selfish gene')
+        self.update(u'B', u'Gene is a unit of heredity. ' + u'Filler text. ' * 20)
+        self.update(u'C', u'Nothing')
+        self.assertEqual([u'A', u'B'], self.titles(u'gene'))
+
+    def test_korean(self):
+        self.update(u'A', u'이기적 유전자')
+        self.update(u'B', u'유전자는 유전의 단위')
+        self.update(u'C', u'이기적인 사람')
+        self.assertEqual(set([u'A', u'B']), set(self.titles(u'유전자')))
+        self.assertEqual(u'A', self.titles(u'이기적 유전자')[0])
+
+    def test_snippet(self):
+        self.update(u'A', u'The selfish gene')
+        result = WikiPage.text_search(u'selfish')[0]
+        self.assertEqual(u'The selfish gene', result['snippet'])
+        self.assertEqual([(4, 11)], result['highlights'])
+
+    def test_incremental_update(self):
+        self.update(u'A', u'The selfish gene')
+        self.update(u'A', u'The extended phenotype')
+        self.assertEqual([], self.titles(u'selfish'))
+        self.assertEqual([u'A'], self.titles(u'phenotype'))
+
+    def test_cached_result_is_invalidated_by_its_terms_only(self):
+        self.update(u'A', u'The selfish gene')
+        self.assertEqual([u'A'], self.titles(u'selfish'))
+
+        def cached(term):
+            generations = cache.get_generations([u'text_index\t%s' % term])
+            return cache.get_text_search([term], generations)
+
+        self.update(u'B', u'The extended phenotype')
+        self.assertIsNotNone(cached(u'selfish'))
+
+        self.update(u'C', u'Selfish')
+        self.assertIsNone(cached(u'selfish'))
+        self.assertEqual(set([u'A', u'C']), set(self.titles(u'selfish')))
+
+    def test_deleted_page(self):
+        os.environ['USER_EMAIL'] = 'a@x.com'
+        os.environ['USER_ID'] = 'a'
+        os.environ['USER_IS_ADMIN'] = '1'
+
+        self.update(u'A', u'The selfish gene')
+        WikiPage.get_by_title(u'A').delete(users.get_current_user())
+        WikiPage._update_text_index_deferred(u'A')
+        self.assertEqual([], self.titles(u'selfish'))
+
+    def test_acl(self):
+        self.update(u'A', u'.read admin@gmail.com\nThe selfish gene')
+        self.assertEqual([], self.titles(u'selfish'))
+        self.assertEqual([u'A'], self.titles(u'selfish', users.User('admin@gmail.com')))
+
+    def test_max_hits(self):
+        self.update(u'A', u'.read admin@gmail.com\nThe selfish gene')
+        self.update(u'B', u'.read admin@gmail.com\nThe selfish gene')
+        self.update(u'C', u'Selfish. ' + u'Filler text. ' * 20)
+
+        max_hits = WikiPage.text_search_max_hits
+        WikiPage.text_search_max_hits = 2
+        try:
+            self.assertEqual([], self.titles(u'selfish'))
+        finally:
+            WikiPage.text_search_max_hits = max_hits
+        self.assertEqual([u'C'], self.titles(u'selfish'))
+
+
+class WikiPageTitleIndexTest(unittest.TestCase):
+    def setUp(self):
+        cache.prc.flush_all()
+        cache._instance_cache.clear()
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def test_complete_by_popularity(self):
+        WikiPage.get_by_title(u'Apple').update_content(u'Hello', 0)
+        WikiPage.get_by_title(u'Apricot').update_content(u'Hello', 0)
+        WikiPage.get_by_title(u'Banana').update_content(u'[[Apricot]]', 0)
+        self.assertEqual([u'Apricot', u'Apple'], WikiPage.get_title_index().complete(u'ap'))
+
+    def test_new_title(self):
+        WikiPage.get_by_title(u'Apple').update_content(u'Hello', 0)
+        self.assertEqual([u'Apple'], WikiPage.get_title_index().complete(u'a'))
+
+        cache.prc.flush_all()
+        WikiPage.get_by_title(u'Apricot').update_content(u'Hello', 0)
+        self.assertEqual([u'Apple', u'Apricot'], WikiPage.get_title_index().complete(u'a'))
+
+    def test_acl(self):
+        WikiPage.get_by_title(u'Apple').update_content(u'.read admin@gmail.com\nHello', 0)
+        self.assertEqual([], WikiPage.complete_titles(u'a'))
+        self.assertEqual([u'Apple'], WikiPage.complete_titles(u'a', users.User('admin@gmail.com')))
+
+    def test_chosung_acl(self):
+        WikiPage.get_by_title(u'서가').update_content(u'.read admin@gmail.com\nHello', 0)
+        self.assertEqual([], WikiPage.complete_titles(u'ㅅㄱ'))
+        self.assertEqual([u'서가'], WikiPage.complete_titles(u'ㅅㄱ', users.User('admin@gmail.com')))
+
+    def test_fuzzy_acl(self):
+        WikiPage.get_by_title(u'Python').update_content(u'.read admin@gmail.com\nHello', 0)
+        WikiPage.get_by_title(u'Jython').update_content(u'Hello', 0)
+        self.assertEqual([u'Jython'], WikiPage.complete_titles(u'Pyhton'))
+        self.assertEqual([u'Python', u'Jython'], WikiPage.complete_titles(u'Pyhton', users.User('admin@gmail.com')))
+
+    def test_trigram_index_should_be_updated_incrementally(self):
+        WikiPage.get_by_title(u'Hello world').update_content(u'Hello', 0)
+        index = WikiPage.get_trigram_index()
+        self.assertEqual([u'Hello world'], [title for title, _ in index.search(u'hello')])
+
+        cache.prc.flush_all()
+        WikiPage.get_by_title(u'Say hello').update_content(u'Hello', 0)
+        os.environ['USER_EMAIL'] = 'a@x.com'
+        os.environ['USER_ID'] = 'a'
+        os.environ['USER_IS_ADMIN'] = '1'
+        WikiPage.get_by_title(u'Hello world').delete(users.get_current_user())
+        cache.prc.flush_all()
+        self.assertIs(index, WikiPage.get_trigram_index())
+        self.assertEqual([u'Say hello'], [title for title, _ in index.search(u'hello')])
+
+    def test_trigram_index_should_be_rebuilt_without_change_log(self):
+        WikiPage.get_by_title(u'Hello world').update_content(u'Hello', 0)
+        index = WikiPage.get_trigram_index()
+
+        cache.prc.flush_all()
+        WikiPage.get_by_title(u'Say hello').update_content(u'Hello', 0)
+        memcache.delete(u'model\ttitle_change\t%d' % cache.get_generation('titles'))
+        self.assertIsNot(index, WikiPage.get_trigram_index())
+        self.assertEqual(2, len(WikiPage.get_trigram_index()))
+
+    def test_similar_titles_should_be_readable(self):
+        WikiPage.get_by_title(u'Hello world').update_content(u'.read admin@gmail.com\nHello', 0)
+        WikiPage.get_by_title(u'Say hello').update_content(u'Hello', 0)
+        groups = WikiPage.get_by_title(u'Hello').get_similar_titles(None)
+        self.assertEqual([], groups[u'startswiths'])
+        self.assertEqual([u'Say hello'], groups[u'endswiths'])
+
+
+class WikiPageRedirectMapTest(unittest.TestCase):
+    def setUp(self):
+        cache.prc.flush_all()
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def test_compress_chain(self):
+        actual = compress_redirects({u'A': u'B', u'B': u'C', u'C': u'D'})
+        self.assertEqual({u'A': u'D', u'B': u'D', u'C': u'D'}, actual)
+
+    def test_compress_loop(self):
+        actual = compress_redirects({u'A': u'B', u'B': u'C', u'C': u'B'})
+        self.assertEqual({u'A': u'B', u'B': u'B', u'C': u'C'}, actual)
+
+    def test_redirect_map(self):
+        WikiPage.get_by_title(u'A').update_content(u'.redirect B', 0)
+        WikiPage.get_by_title(u'B').update_content(u'.redirect C', 0)
+        self.assertEqual({u'A': u'C', u'B': u'C'}, WikiPage.get_redirect_map())
+        self.assertEqual(u'C', WikiPage.resolve_redirect(u'A'))
+        self.assertEqual(u'D', WikiPage.resolve_redirect(u'D'))
+
+        WikiPage.get_by_title(u'B').update_content(u'Hello', 1)
+        self.assertEqual({u'A': u'B'}, WikiPage.get_redirect_map())
+
+    def test_redirect_map_should_survive_cache_eviction(self):
+        WikiPage.get_by_title(u'A').update_content(u'.redirect B', 0)
+        WikiPage.get_redirect_map()
+        memcache.flush_all()
+        cache.prc.flush_all()
+        self.assertEqual({u'A': u'B'}, WikiPage.get_redirect_map())
+
+    def test_follow_redirect_loop(self):
+        WikiPage.get_by_title(u'A').update_content(u'.redirect B', 0)
+        WikiPage.get_by_title(u'B').update_content(u'.redirect A', 0)
+        self.assertEqual(u'A', WikiPage.get_by_title(u'A', follow_redirect=True).title)
+        self.assertEqual(u'B', WikiPage.get_by_title(u'B', follow_redirect=True).title)
+
+
 class WikiPageHashbang(unittest.TestCase):
     def setUp(self):
         self.testbed = testbed.Testbed()
@@ -876,8 +1550,8 @@ class PageOperationMixinTest(unittest.TestCase):
         self.testbed.deactivate()
 
     def test_rendered_body(self):
-        self.assertTrue(self.page.rendered_body.startswith(u'<p>Hello <a class="wikipage" href="/There">There</a></p>\n<h1>Incoming Links <a id="h_ea3d40041db650b8c49e9a81fb17e208" href="#h_ea3d40041db650b8c49e9a81fb17e208" class="caret-target">#</a></h1>\n<h2>Related pages <a id="h_466b0df4e8bf6d9144017ce2e7321748" href="#h_466b0df4e8bf6d9144017ce2e7321748" class="caret-target">#</a></h2>\n<ul>\n<li><a class="wikipage" href="/Other">Other</a></li>\n</ul>'))
-        self.assertTrue(self.revision.rendered_body.startswith(u'<p>Hello <a class="wikipage" href="/There">There</a></p>'))
+        self.assertTrue(self.page.rendered_body.startswith(u'<p>Hello <a class="wikipage missing" href="/There">There</a></p>\n<h1>Incoming Links <a id="h_ea3d40041db650b8c49e9a81fb17e208" href="#h_ea3d40041db650b8c49e9a81fb17e208" class="caret-target">#</a></h1>\n<h2>Related pages <a id="h_466b0df4e8bf6d9144017ce2e7321748" href="#h_466b0df4e8bf6d9144017ce2e7321748" class="caret-target">#</a></h2>\n<ul>\n<li><a class="wikipage" href="/Other">Other</a></li>\n</ul>'))
+        self.assertTrue(self.revision.rendered_body.startswith(u'<p>Hello <a class="wikipage missing" href="/There">There</a></p>'))
 
     def test_is_old_revision(self):
         self.assertEqual(False, self.page.is_old_revision)
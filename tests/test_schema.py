@@ -2,8 +2,10 @@
 import cache
 import schema
 import unittest2 as unittest
+from datetime import date
+from google.appengine.ext import ndb
 from google.appengine.ext import testbed
-from models import WikiPage, SchemaDataIndex
+from models import WikiPage, SchemaDataIndex, SchemaDataCount, DataIndexRebuild
 
 
 class SchemaPathTest(unittest.TestCase):
@@ -17,6 +19,18 @@ class SchemaPathTest(unittest.TestCase):
         self.assertEqual('Published date',
                          schema.humane_property('Book', 'datePublished', False))
 
+    def test_date_period(self):
+        self.assertEqual((date(2013, 1, 1), date(2014, 1, 1)), schema.parse_date_period(u'2013'))
+        self.assertEqual((date(2013, 12, 1), date(2014, 1, 1)), schema.parse_date_period(u'2013-12'))
+        self.assertEqual((date(2013, 2, 28), date(2013, 3, 1)), schema.parse_date_period(u'2013-02-28'))
+        self.assertIsNone(schema.parse_date_period(u'2013-13'))
+        self.assertIsNone(schema.parse_date_period(u'Summer'))
+
+    def test_coerce_value(self):
+        self.assertEqual((date(1979, 1, 1), None), schema.coerce_value('datePublished', u'1979'))
+        self.assertEqual((None, 1979.0), schema.coerce_value('pages', u'1979'))
+        self.assertEqual((None, None), schema.coerce_value('author', u'AK'))
+
     def test_itemtype_path(self):
         self.assertEqual('Thing/',
                          schema.get_itemtype_path('Thing'))
@@ -128,3 +142,52 @@ class SchemaIndexTest(unittest.TestCase):
         self.assertEqual(1, SchemaDataIndex.query(SchemaDataIndex.title == u'Hello', SchemaDataIndex.name == u'isbn', SchemaDataIndex.value == u'123456780').count())
         self.assertEqual(0, SchemaDataIndex.query(SchemaDataIndex.title == u'Hello', SchemaDataIndex.name == u'datePublished', SchemaDataIndex.value == u'2013').count())
         self.assertEqual(1, SchemaDataIndex.query(SchemaDataIndex.title == u'Hello', SchemaDataIndex.name == u'dateModified', SchemaDataIndex.value == u'2013').count())
+
+    def test_schema_index_deferred_update(self):
+        page = WikiPage.get_by_title(u'Hello')
+        page.update_content(u'.schema Book\n[[author::AK]]\n{{isbn::123456789}}', 0)
+        page.rebuild_data_index()
+        old_data = page.data
+        page.update_content(u'.schema Book\n[[author::AK]]\n{{isbn::123456780}}', 1)
+        page.rebuild_data_index_deferred(old_data, page.data)
+        self.assertEqual(0, SchemaDataIndex.query(SchemaDataIndex.title == u'Hello', SchemaDataIndex.name == u'isbn', SchemaDataIndex.value == u'123456789').count())
+        self.assertEqual(1, SchemaDataIndex.query(SchemaDataIndex.title == u'Hello', SchemaDataIndex.name == u'isbn', SchemaDataIndex.value == u'123456780').count())
+
+    def test_rebuild_all(self):
+        for title in [u'A', u'B', u'C']:
+            WikiPage.get_by_title(title).update_content(u'.schema Book\n[[author::AK]]', 0)
+        ndb.delete_multi(SchemaDataIndex.query().fetch(keys_only=True))
+
+        job_id = WikiPage.rebuild_all_data_index(num_shards=2, batch_size=1)
+        job = DataIndexRebuild.get_by_id(u'latest')
+        self.assertEqual((3, 2), (job.num_pages, job.num_shards))
+
+        WikiPage._rebuild_data_index_shard(job_id, None, u'B', None, 1)
+        WikiPage._rebuild_data_index_shard(job_id, u'B', None, None, 2)
+        job = DataIndexRebuild.get_by_id(u'latest')
+        self.assertEqual((3, 2), (job.processed_pages, job.finished_shards))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(3, SchemaDataIndex.query(SchemaDataIndex.name == u'author').count())
+
+    def test_superseded_rebuild(self):
+        job_id = DataIndexRebuild.start(10, 2)
+        DataIndexRebuild.start(10, 2)
+        self.assertFalse(DataIndexRebuild.add_progress(job_id, 1, False))
+
+    def test_compact(self):
+        page = WikiPage.get_by_title(u'Hello')
+        page.update_content(u'.schema Book\n[[author::AK]]', 0)
+        page.rebuild_data_index()
+
+        # rows written before keys were deterministic
+        SchemaDataIndex(title=u'Hello', name=u'author', value=u'AK', data={}).put()
+        SchemaDataIndex(title=u'Hello', name=u'author', value=u'Old', data={}).put()
+        SchemaDataIndex(title=u'Nothing', name=u'author', value=u'AK', data={}).put()
+        ndb.delete_multi(SchemaDataCount.query().fetch(keys_only=True))
+
+        self.assertEqual(3, WikiPage.compact_data_index())
+        index = SchemaDataIndex.query(SchemaDataIndex.name == u'author').fetch()
+        self.assertEqual([SchemaDataIndex._key_of(u'Hello', u'author', u'AK')],
+                         [i.key for i in index])
+        self.assertEqual({(u'author', u'AK'): 1},
+                         SchemaDataCount.get_estimates([(u'author', u'AK')]))
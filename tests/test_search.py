@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
+import random
 import search
+import pyparsing as p
 import unittest2 as unittest
 
 
@@ -20,6 +22,11 @@ class ExpressionParserTest(unittest.TestCase):
         actual = search.parse_expression(u'+What the -Fun +Is it')
         self.assertEqual(expected, actual)
 
+    def test_format(self):
+        self.assertEqual(u'+A +B -C', search.format_expression([u'A', u'B'], [u'C']))
+        parsed = search.parse_expression(u'+A +B -C')
+        self.assertEqual(u'+A +B -C', search.format_expression(parsed['pos'], parsed['neg']))
+
     def test_no_space(self):
         expected = {
             'pos': [u'User-centered design'],
@@ -77,3 +84,153 @@ class EvaluationTest(unittest.TestCase):
         expected = [u'C', u'B', u'D', u'A', u'E']
         actual = search.evaluate(positives, negatives).keys()
         self.assertEqual(expected, actual)
+
+        # top-k
+        actual = search.evaluate(positives, negatives, limit=2).keys()
+        self.assertEqual(expected[:2], actual)
+
+        # unsorted
+        actual = search.calculate_scores(positives, negatives)
+        self.assertEqual(set(expected), set(actual.keys()))
+        self.assertEqual(search.evaluate(positives, negatives), search.sort_scores(actual))
+
+    def test_many_operands(self):
+        positives = dict((u'P%d' % i, {u'A': 1.0, u'P%d' % (i + 1): 1.0}) for i in range(100))
+        negatives = {u'N': {u'B': 1.0}}
+        actual = search.evaluate(positives, negatives)
+        self.assertEqual([u'A', u'P100', u'B'], actual.keys())
+        self.assertAlmostEqual(100 / 101.0, actual[u'A'])
+
+    def test_split_scores(self):
+        scoretable = {u'A': 0.3, u'B': 0.1, u'C': 0.0, u'D': -0.2, u'E': -0.1}
+        positives, negatives = search.split_scores(scoretable, 2)
+        self.assertEqual([(u'A', 0.3), (u'B', 0.1)], positives.items())
+        self.assertEqual([(u'D', 0.2), (u'E', 0.1)], negatives.items())
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_evict_least_recently_used(self):
+        lru = search.LRUCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(1, lru.get('a'))
+        self.assertEqual(None, lru.get('b'))
+        self.assertEqual(3, lru.get('c'))
+        self.assertEqual(2, len(lru))
+
+
+class WikiqueryParseCacheTest(unittest.TestCase):
+    def setUp(self):
+        search.parsed_wikiqueries.clear()
+
+    def test_cached(self):
+        parsed = search.parse_wikiquery(u'"A" * "B"')
+        self.assertEqual(1, len(search.parsed_wikiqueries))
+        self.assertEqual(parsed, search.parse_wikiquery(u'"A" * "B"'))
+        self.assertEqual(1, len(search.parsed_wikiqueries))
+
+    def test_returns_copy(self):
+        parsed = search.parse_wikiquery(u'"A"')
+        parsed[0][1] = u'B'
+        self.assertEqual([[u'name', u'A'], [u'name']], search.parse_wikiquery(u'"A"'))
+
+
+# pyparsing grammar which search.parse_wikiquery() replaced, with `> *` and
+# comparisons added
+identifier = p.Regex(r'([a-zA-Z_][.0-9a-zA-Z_]*)')
+double_quote_str = p.dblQuotedString.setParseAction(p.removeQuotes)
+
+page_query_expr = p.Forward()
+attr_expr = p.Forward()
+
+expr = page_query_expr + p.Optional(p.Suppress('>') + attr_expr)
+expr.setParseAction(lambda x: x if len(x) == 2 else [x[0], ['name']])
+
+page_query_term = p.Group(p.Optional(identifier + p.Suppress(':')) + double_quote_str)
+page_query_term.setParseAction(lambda x: x if len(x[0]) == 2 else [['name', x[0][0]]])
+page_query_term = p.Group(identifier + p.oneOf(search.comparisons) + double_quote_str) | page_query_term
+page_query_expr << p.operatorPrecedence(page_query_term, [
+    (p.Literal('*'), 2, p.opAssoc.LEFT),
+    (p.Literal('+'), 2, p.opAssoc.LEFT),
+])
+
+attr_expr << (p.Group(p.Literal('*')) | p.Group(p.delimitedList(identifier)))
+
+
+def legacy_parse_wikiquery(q):
+    try:
+        return expr.parseString(q, parseAll=True).asList()
+    except p.ParseException:
+        return None
+
+
+def parse_wikiquery(q):
+    try:
+        return search.parse_wikiquery(q)
+    except search.WikiqueryError:
+        return None
+
+
+def random_wikiquery(rand, depth=0):
+    def operand():
+        if depth < 3 and rand.random() < 0.2:
+            return u'(%s)' % random_wikiquery(rand, depth + 1)
+        name = rand.choice([u'', u'name:', u'schema:', u'a.b_1 : ', u'date >= ', u'n^=', u'n<'])
+        value = rand.choice([u'', u'A', u'B C', u'\\"', u'x""y', u'\uac00'])
+        return u'%s"%s"' % (name, value)
+
+    q = operand()
+    for _ in range(rand.randint(0, 3)):
+        q += rand.choice([u' * ', u'+', u' + ', u'*\n']) + operand()
+    if depth == 0 and rand.random() < 0.5:
+        q += u' > ' + u', '.join(rand.sample([u'name', u'author', u'x.y', u'_z'], rand.randint(1, 3)))
+    return q
+
+
+class WikiqueryParserTest(unittest.TestCase):
+    def test_precedence(self):
+        self.assertEqual([[['name', 'A'], '+', [['name', 'B'], '*', ['name', 'C']], '+', ['name', 'D']], ['name']],
+                         search.parse_wikiquery(u'"A" + "B" * "C" + "D"'))
+        self.assertEqual([[[['name', 'A'], '+', ['name', 'B']], '*', ['name', 'C']], ['name']],
+                         search.parse_wikiquery(u'(("A" + "B")) * ("C")'))
+
+    def test_comparison(self):
+        self.assertEqual([[['schema', 'Book'], '*', ['datePublished', '>=', '2013']], ['name']],
+                         search.parse_wikiquery(u'schema:"Book" * datePublished >= "2013"'))
+        self.assertEqual([['name', '^=', 'A'], ['name']],
+                         search.parse_wikiquery(u'name^="A" > name'))
+        self.assertEqual([['n', '>', 'A'], ['name', 'n']],
+                         search.parse_wikiquery(u'n > "A" > name, n'))
+
+    def test_all_attributes(self):
+        self.assertEqual([['name', 'A'], ['*']], search.parse_wikiquery(u'"A" > *'))
+        self.assertRaises(search.WikiqueryError, search.parse_wikiquery, u'"A" > *, name')
+
+    def test_error_position(self):
+        for q, pos in [(u'', 0), (u'"A" *', 5), (u'"A" > a b', 8), (u'("A"', 4),
+                       (u'foo "A"', 4), (u'"A" & "B"', 4), (u'"A" > a,', 8), (u'"A', 0)]:
+            with self.assertRaises(search.WikiqueryError) as cm:
+                search.parse_wikiquery(q)
+            self.assertEqual(pos, cm.exception.pos, q)
+
+    def test_same_as_legacy_parser(self):
+        rand = random.Random(0)
+        for _ in range(500):
+            q = random_wikiquery(rand)
+            self.assertEqual(legacy_parse_wikiquery(q), parse_wikiquery(q), q)
+
+    def test_same_as_legacy_parser_on_mutations(self):
+        rand = random.Random(0)
+        chars = u' "():*+<>=^,.:_aZ1\\\n\uac00'
+        for _ in range(1000):
+            q = list(random_wikiquery(rand))
+            for _ in range(rand.randint(1, 3)):
+                pos = rand.randint(0, len(q))
+                if rand.random() < 0.5 and pos < len(q):
+                    del q[pos]
+                else:
+                    q.insert(pos, rand.choice(chars))
+            q = u''.join(q)
+            self.assertEqual(legacy_parse_wikiquery(q), parse_wikiquery(q), q)
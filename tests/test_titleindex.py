@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+import unittest2 as unittest
+from titleindex import BloomFilter, TitleFilter, PrefixIndex, ChosungIndex, TrigramIndex, FuzzyIndex, \
+    to_chosung, has_chosung, edit_distance
+
+
+class BloomFilterTest(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        titles = [u'Title %d' % i for i in range(1000)]
+        for title in titles:
+            bloom.add(title)
+        for title in titles:
+            self.assertTrue(title in bloom)
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(u'Title %d' % i)
+        false_positives = sum(1 for i in range(10000) if u'Other %d' % i in bloom)
+        self.assertLess(false_positives, 300)
+
+    def test_unicode(self):
+        bloom = BloomFilter(10)
+        bloom.add(u'가나다')
+        self.assertTrue(u'가나다' in bloom)
+
+
+class TitleFilterTest(unittest.TestCase):
+    def test_contains(self):
+        f = TitleFilter([u'A', u'B'])
+        self.assertTrue(u'A' in f)
+        self.assertFalse(u'C' in f)
+
+    def test_add_and_remove(self):
+        f = TitleFilter([u'A', u'B'])
+        f.add(u'C')
+        f.remove(u'A')
+        self.assertTrue(u'C' in f)
+        self.assertFalse(u'A' in f)
+        self.assertEqual(2, f.changes)
+
+        f.add(u'A')
+        self.assertTrue(u'A' in f)
+
+    def test_empty(self):
+        f = TitleFilter([])
+        self.assertFalse(u'A' in f)
+
+
+class PrefixIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = PrefixIndex([u'Apple', u'apricot', u'Banana', u'Application', u'App'],
+                                 {u'Application': 10, u'apricot': 5})
+
+    def test_ranked_by_popularity(self):
+        self.assertEqual([u'Application', u'apricot', u'App', u'Apple'],
+                         self.index.complete(u'ap'))
+
+    def test_limit(self):
+        self.assertEqual([u'Application', u'App'], self.index.complete(u'APP', 2))
+
+    def test_no_match(self):
+        self.assertEqual([], self.index.complete(u'cherry'))
+
+    def test_empty_prefix(self):
+        self.assertEqual([u'Application', u'apricot'], self.index.complete(u'', 2))
+
+    def test_titles(self):
+        self.assertEqual([u'apricot', u'Apple'],
+                         self.index.complete(u'ap', titles=set([u'Apple', u'apricot', u'Banana'])))
+
+    def test_unicode(self):
+        index = PrefixIndex([u'가나다', u'가나', u'나'])
+        self.assertEqual([u'가나', u'가나다'], index.complete(u'가'))
+
+    def test_matches_linear_scan(self):
+        import random
+        rand = random.Random(0)
+        titles = set(u''.join(rand.choice(u'abc') for _ in range(rand.randint(1, 5)))
+                     for _ in range(300))
+        popularity = dict((t, rand.randint(0, 3)) for t in titles)
+        index = PrefixIndex(titles, popularity)
+        for prefix in [u'', u'a', u'ab', u'cab', u'bbb']:
+            expected = sorted([t for t in titles if t.startswith(prefix)],
+                              key=lambda t: (-popularity[t], t))[:7]
+            self.assertEqual(expected, index.complete(prefix, 7))
+
+
+class ChosungIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = ChosungIndex([u'서가', u'책 서가', u'사과', u'서가ㄴ', u'Seoga', u'성공'])
+
+    def titles(self, query):
+        return [title for title, _ in self.index.search(query)]
+
+    def test_to_chosung(self):
+        self.assertEqual(u'ㅅㄱ abc', to_chosung(u'서가 ABC'))
+
+    def test_has_chosung(self):
+        self.assertTrue(has_chosung(u'ㅅ가'))
+        self.assertFalse(has_chosung(u'서가'))
+
+    def test_consonants(self):
+        self.assertEqual([u'사과', u'서가', u'서가ㄴ', u'성공', u'책 서가'], self.titles(u'ㅅㄱ'))
+
+    def test_mixed(self):
+        self.assertEqual([u'서가', u'서가ㄴ', u'책 서가'], self.titles(u'서ㄱ'))
+        self.assertEqual([u'성공'], self.titles(u'ㅅ공'))
+
+    def test_start(self):
+        self.assertEqual([(u'책 서가', 2)], self.index.search(u'ㅅㄱ')[-1:])
+
+    def test_limit(self):
+        self.assertEqual(2, len(self.index.search(u'ㅅ', limit=2)))
+
+    def test_later_occurrence(self):
+        index = ChosungIndex([u'사과와 서가'])
+        self.assertEqual([(u'사과와 서가', 4)], index.search(u'서ㄱ'))
+
+
+class TrigramIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = TrigramIndex([u'Hello world', u'Say hello', u'Othello', u'Help'])
+
+    def test_search(self):
+        self.assertEqual([(u'Hello world', u'startswiths'),
+                          (u'Othello', u'endswiths'),
+                          (u'Say hello', u'endswiths')], self.index.search(u'hello'))
+
+    def test_contains(self):
+        self.assertEqual([(u'Hello world', u'contains')], self.index.search(u'lo wo'))
+
+    def test_short_target(self):
+        self.assertEqual([u'Hello world', u'Help', u'Othello', u'Say hello'],
+                         [title for title, _ in self.index.search(u'el')])
+
+    def test_no_match(self):
+        self.assertEqual([], self.index.search(u'world peace'))
+        self.assertEqual([], self.index.search(u''))
+
+    def test_add_and_remove(self):
+        self.index.add(u'Hello kitty')
+        self.index.remove(u'Othello')
+        self.assertEqual([u'Hello kitty', u'Hello world', u'Say hello'],
+                         [title for title, _ in self.index.search(u'hello')])
+        self.assertFalse(u'oth' in self.index.postings)
+
+    def test_normalize(self):
+        index = TrigramIndex([u'The (Hello) World'], lambda t: t.lower().replace(u' ', u''))
+        self.assertEqual([(u'The (Hello) World', u'endswiths')], index.search(u'World'))
+
+
+class FuzzyIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = FuzzyIndex([u'Python', u'Pythons', u'Typhon', u'Jython', u'Ruby', u'Perl'],
+                                popularity={u'Jython': 3})
+
+    def test_edit_distance(self):
+        self.assertEqual(0, edit_distance(u'abc', u'abc', 2))
+        self.assertEqual(1, edit_distance(u'abc', u'abd', 2))
+        self.assertEqual(1, edit_distance(u'abc', u'acb', 2))
+        self.assertEqual(2, edit_distance(u'abc', u'a', 2))
+        self.assertEqual(3, edit_distance(u'abcdef', u'a', 2))
+
+    def test_suggest(self):
+        self.assertEqual([u'Python', u'Jython', u'Pythons'], self.index.suggest(u'pyhton'))
+
+    def test_exact_match_is_excluded(self):
+        self.assertEqual([u'Jython', u'Pythons', u'Typhon'], self.index.suggest(u'python'))
+
+    def test_popularity(self):
+        self.assertEqual([u'Jython', u'Python'], self.index.suggest(u'xython', limit=2))
+
+    def test_no_suggestion(self):
+        self.assertEqual([], self.index.suggest(u'Haskell'))
+        self.assertEqual([], self.index.suggest(u''))
+
+    def test_titles(self):
+        self.assertEqual([u'Python', u'Pythons'],
+                         self.index.suggest(u'pyhton', titles=set([u'Python', u'Pythons'])))
+
+    def test_add_and_remove(self):
+        self.index.remove(u'Jython')
+        self.index.add(u'Cython')
+        self.assertEqual([u'Cython', u'Pythons', u'Typhon'], self.index.suggest(u'python'))
+
+        self.index.add(u'Jython')
+        self.assertEqual([u'Jython', u'Cython', u'Pythons', u'Typhon'], self.index.suggest(u'python'))
+
+    def test_long_titles(self):
+        index = FuzzyIndex([u'Structure and interpretation'])
+        self.assertEqual([u'Structure and interpretation'],
+                         index.suggest(u'Structure and interpretatoin'))
+        self.assertEqual([u'Structure and interpretation'],
+                         index.suggest(u'Strcture and interpretation'))
+
+    def test_matches_linear_scan(self):
+        import random
+        rand = random.Random(0)
+        titles = set(u''.join(rand.choice(u'abcd') for _ in range(rand.randint(1, 9)))
+                     for _ in range(300))
+        index = FuzzyIndex(titles, max_distance=2, prefix_length=4)
+        for target in [u'abcabc', u'dd', u'abcdabcd', u'a']:
+            expected = sorted((edit_distance(target, t, 2), t) for t in titles
+                              if 0 < edit_distance(target, t, 2) <= 2)
+            self.assertEqual([t for _, t in expected][:20], index.suggest(target, limit=20, max_distance=2))
+
+    def test_short_target(self):
+        index = FuzzyIndex([u'Ruby', u'Rub', u'Go'])
+        self.assertEqual([u'Ruby'], index.suggest(u'rbuy'))
+        self.assertEqual([u'Ruby', u'Rub'], index.suggest(u'rbuy', max_distance=2))
+
+    def test_edit_distance_matches_full_table(self):
+        def full(a, b):
+            table = [[i + j if i * j == 0 else 0 for j in range(len(b) + 1)] for i in range(len(a) + 1)]
+            for i in range(1, len(a) + 1):
+                for j in range(1, len(b) + 1):
+                    table[i][j] = min(table[i - 1][j] + 1, table[i][j - 1] + 1,
+                                      table[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+                    if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                        table[i][j] = min(table[i][j], table[i - 2][j - 2] + 1)
+            return table[len(a)][len(b)]
+
+        import random
+        rand = random.Random(0)
+        for _ in range(500):
+            a = u''.join(rand.choice(u'abc') for _ in range(rand.randint(0, 8)))
+            b = u''.join(rand.choice(u'abc') for _ in range(rand.randint(0, 8)))
+            for max_distance in [1, 2]:
+                self.assertEqual(min(full(a, b), max_distance + 1), edit_distance(a, b, max_distance))
@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 import cache
-from models import WikiPage
+from models import WikiPage, SchemaDataCount
 import unittest2 as unittest
 from google.appengine.api import users
 from search import parse_wikiquery as p
+from google.appengine.ext import ndb
 from google.appengine.ext import testbed
 
 
@@ -116,6 +117,75 @@ class WikiqueryEvaluationTest(unittest.TestCase):
         self.assertEqual([{'name': u"The Mind's I"}, {'name': u'GEB'}],
                          WikiPage.wikiquery(u'schema:"Book" + author:"Douglas Hofstadter" * author:"Daniel Dennett"'))
 
+    def test_missing_attr(self):
+        self.assertEqual({u'name': u'Douglas Hofstadter', u'author': None},
+                         WikiPage.wikiquery(u'"Douglas Hofstadter" > name, author'))
+
+    def test_all_attrs(self):
+        self.assertEqual(WikiPage.get_by_title(u'GEB').data,
+                         WikiPage.wikiquery(u'"GEB" > *'))
+
+    def test_all_attrs_after_partial_update(self):
+        page = WikiPage.get_by_title(u'GEB')
+        old_data = page.data
+        page.update_content(page.body + u'\n{{isbn::0465026567}}', 1, u'')
+        page.rebuild_data_index_deferred(old_data, page.data)
+        cache.prc.flush_all()
+        self.assertEqual(u'0465026567', WikiPage.wikiquery(u'"GEB" > *')[u'isbn'])
+
+    def test_date_range(self):
+        self.assertEqual({u'name': u'The Mind\'s I'},
+                         WikiPage.wikiquery(u'datePublished >= "1980"'))
+        self.assertEqual({u'name': u'GEB'},
+                         WikiPage.wikiquery(u'datePublished <= "1979"'))
+        self.assertEqual({u'name': u'GEB'},
+                         WikiPage.wikiquery(u'datePublished < "1979-06"'))
+        self.assertEqual({u'name': u'The Mind\'s I'},
+                         WikiPage.wikiquery(u'schema:"Book" * datePublished > "1979"'))
+
+    def test_prefix(self):
+        self.assertEqual({u'name': u'The Mind\'s I'},
+                         WikiPage.wikiquery(u'author ^= "Daniel"'))
+        self.assertEqual({u'name': u'Douglas Hofstadter'},
+                         WikiPage.wikiquery(u'schema ^= "Thing/Person/"'))
+
+    def test_prefix_followed_by_astral_character(self):
+        page = WikiPage.get_by_title(u'GEB')
+        old_data = page.data
+        page.update_content(page.body + u'\n{{isbn::0465\U0001f4d6}}', 1, u'')
+        page.rebuild_data_index_deferred(old_data, page.data)
+        cache.prc.flush_all()
+        self.assertEqual({u'name': u'GEB'}, WikiPage.wikiquery(u'isbn ^= "0465"'))
+
+    def test_counts(self):
+        self.assertEqual({(u'author', u'Douglas Hofstadter'): 2,
+                          (u'schema', u'Thing/CreativeWork/Book/'): 2,
+                          (u'author', u'Nobody'): float('inf')},
+                         SchemaDataCount.get_estimates([(u'author', u'Douglas Hofstadter'),
+                                                        (u'schema', u'Thing/CreativeWork/Book/'),
+                                                        (u'author', u'Nobody')]))
+
+        page = WikiPage.get_by_title(u'GEB')
+        old_data = page.data
+        page.update_content(u'.schema Book\n[[datePublished::1979]]', 1, u'')
+        page.rebuild_data_index_deferred(old_data, page.data)
+        self.assertEqual({(u'author', u'Douglas Hofstadter'): 1},
+                         SchemaDataCount.get_estimates([(u'author', u'Douglas Hofstadter')]))
+
+    def test_check_candidates(self):
+        candidates = set([u'GEB', u'The Mind\'s I'])
+        estimates = {(u'author', u'Daniel Dennett'): 1000}
+        self.assertEqual(set([u'The Mind\'s I']),
+                         WikiPage._evaluate_titles([u'author', u'Daniel Dennett'], estimates, candidates))
+        estimates = {(u'author', u'Daniel Dennett'): 1}
+        self.assertEqual(set([u'The Mind\'s I']),
+                         WikiPage._evaluate_titles([u'author', u'Daniel Dennett'], estimates, candidates))
+
+    def test_without_counts(self):
+        ndb.delete_multi(SchemaDataCount.query().fetch(keys_only=True))
+        self.assertEqual({u'name': u'The Mind\'s I'},
+                         WikiPage.wikiquery(u'schema:"Book" * author:"Douglas Hofstadter" * author:"Daniel Dennett"'))
+
     def test_complex(self):
         self.assertEqual([{u'name': u'The Mind\'s I', u'author': [u'Daniel Dennett', u'Douglas Hofstadter']},
                           {u'author': u'Douglas Hofstadter', u'name': u'GEB'}],
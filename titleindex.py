@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+import math
+import heapq
+import bisect
+import hashlib
+import struct
+from array import array
+
+
+class BloomFilter(object):
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.num_bits = int(math.ceil(-capacity * math.log(error_rate) /
+                                      (math.log(2) ** 2)))
+        self.num_hashes = max(int(round(self.num_bits * math.log(2) / capacity)), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def add(self, key):
+        for index in self._indices(key):
+            self.bits[index >> 3] |= 1 << (index & 7)
+
+    def __contains__(self, key):
+        for index in self._indices(key):
+            if not self.bits[index >> 3] & (1 << (index & 7)):
+                return False
+        return True
+
+    def _indices(self, key):
+        # double hashing: h1 + i * h2
+        digest = hashlib.md5(key.encode('utf-8')).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+
+class TitleFilter(object):
+    """Approximate set of existing titles.
+
+    Titles are kept in a bloom filter. Titles added or removed after it has
+    been built are kept in exact sets, so that deleted pages are not reported
+    as existing. Rebuild when `changes` grows large.
+    """
+    def __init__(self, titles, error_rate=0.01):
+        titles = list(titles)
+        self.bloom = BloomFilter(len(titles) * 2, error_rate)
+        for title in titles:
+            self.bloom.add(title)
+        self.added = set()
+        self.removed = set()
+
+    @property
+    def changes(self):
+        return len(self.added) + len(self.removed)
+
+    def add(self, title):
+        self.removed.discard(title)
+        self.added.add(title)
+
+    def remove(self, title):
+        self.added.discard(title)
+        self.removed.add(title)
+
+    def __contains__(self, title):
+        if title in self.removed:
+            return False
+        if title in self.added:
+            return True
+        return title in self.bloom
+
+
+class PrefixIndex(object):
+    """Sorted array of titles answering most popular completions of prefix.
+
+    Titles are compared case-insensitively. A sparse table of range maximum
+    of popularity gives the most popular title in any range in O(1), so top
+    N completions are taken in O(log n + N log N) no matter how many titles
+    share the prefix.
+    """
+    def __init__(self, titles, popularity=None):
+        popularity = popularity or {}
+        entries = sorted((title.lower(), title) for title in titles)
+        self.keys = [key for key, _ in entries]
+        self.titles = [title for _, title in entries]
+        self.scores = [popularity.get(title, 0) for title in self.titles]
+
+        # sparse[j][i]: index of most popular title in [i, i + 2^j)
+        n = len(self.titles)
+        scores = self.scores
+        self.sparse = [array('i', range(n))]
+        j = 1
+        while (1 << j) <= n:
+            prev = self.sparse[-1]
+            half = 1 << (j - 1)
+            self.sparse.append(array('i', [
+                prev[i] if scores[prev[i]] >= scores[prev[i + half]] else prev[i + half]
+                for i in range(n - (1 << j) + 1)
+            ]))
+            j += 1
+
+    def __len__(self):
+        return len(self.titles)
+
+    def complete(self, prefix, limit=10, titles=None):
+        """Returns up to `limit` titles starting with prefix, most popular
+        first. If `titles` is given, titles not in it are skipped."""
+        prefix = prefix.lower()
+        lo = bisect.bisect_left(self.keys, prefix)
+        hi = bisect.bisect_left(self.keys, prefix + u'\uffff', lo)
+
+        results = []
+        heap = [self._entry(lo, hi)] if lo < hi else []
+        while heap and len(results) < limit:
+            _, best, lo, hi = heapq.heappop(heap)
+            if titles is None or self.titles[best] in titles:
+                results.append(self.titles[best])
+            if lo < best:
+                heapq.heappush(heap, self._entry(lo, best))
+            if best + 1 < hi:
+                heapq.heappush(heap, self._entry(best + 1, hi))
+        return results
+
+    def _entry(self, lo, hi):
+        j = (hi - lo).bit_length() - 1
+        a = self.sparse[j][lo]
+        b = self.sparse[j][hi - (1 << j)]
+        if self.scores[b] > self.scores[a]:
+            a = b
+        # ties are broken by title order
+        return -self.scores[a], a, lo, hi
+
+
+CHOSUNG = u'ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ'
+
+
+def is_syllable(c):
+    return u'가' <= c <= u'힣'
+
+
+def to_chosung(text):
+    """Replaces each hangul syllable in lowercased text by its initial consonant"""
+    return u''.join(CHOSUNG[(ord(c) - 0xac00) // 588] if is_syllable(c) else c
+                    for c in text.lower())
+
+
+def has_chosung(text):
+    return any(c in CHOSUNG for c in text)
+
+
+class ChosungIndex(object):
+    """Finds titles by initial consonants of hangul syllables.
+
+    Query `ㅅㄱ` matches `서가` and so does `서ㄱ`: syllables in query should
+    match exactly while consonants only match the initial consonant. Titles
+    are converted by to_chosung() and concatenated into a single string,
+    which is scanned by str.find().
+    """
+    def __init__(self, titles):
+        self.titles = sorted(titles)
+        keys = [to_chosung(title) for title in self.titles]
+        self.offsets = []
+        pos = 0
+        for key in keys:
+            self.offsets.append(pos)
+            pos += len(key) + 1
+        self.text = u'\n'.join(keys)
+
+    def search(self, query, limit=None):
+        """Returns list of (title, start) of matching titles in title order.
+
+        `start` is the position of first match in title.
+        """
+        query = query.lower()
+        key = to_chosung(query)
+        if len(key) == 0:
+            return []
+
+        results = []
+        last = -1
+        pos = self.text.find(key)
+        while pos != -1 and (limit is None or len(results) < limit):
+            i = bisect.bisect_right(self.offsets, pos) - 1
+            start = pos - self.offsets[i]
+            if i != last and self._verify(self.titles[i].lower(), start, query):
+                results.append((self.titles[i], start))
+                last = i
+            pos = self.text.find(key, pos + 1)
+        return results
+
+    @staticmethod
+    def _verify(title, start, query):
+        for i, c in enumerate(query):
+            if is_syllable(c) and title[start + i] != c:
+                return False
+        return True
+
+
+def trigrams(text):
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+class TrigramIndex(object):
+    """Finds titles containing given string by intersecting posting lists
+    of its trigrams.
+
+    Titles are compared after `normalize`. Strings shorter than a trigram
+    are looked up by scanning normalized titles.
+    """
+    def __init__(self, titles=(), normalize=None):
+        self.normalize = normalize or (lambda title: title.lower())
+        self.normalized = {}
+        self.postings = {}
+        for title in titles:
+            self.add(title)
+
+    def __len__(self):
+        return len(self.normalized)
+
+    def add(self, title):
+        if title in self.normalized:
+            return
+        normalized = self.normalize(title)
+        self.normalized[title] = normalized
+        for gram in trigrams(normalized):
+            self.postings.setdefault(gram, set()).add(title)
+
+    def remove(self, title):
+        normalized = self.normalized.pop(title, None)
+        if normalized is None:
+            return
+        for gram in trigrams(normalized):
+            titles = self.postings[gram]
+            titles.discard(title)
+            if len(titles) == 0:
+                del self.postings[gram]
+
+    def search(self, target):
+        """Returns list of (title, kind) in title order, where kind is one
+        of `startswiths`, `endswiths` and `contains`"""
+        normalized_target = self.normalize(target)
+        if len(normalized_target) == 0:
+            return []
+
+        grams = trigrams(normalized_target)
+        if len(grams) > 0:
+            postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+            candidates = postings[0].intersection(*postings[1:])
+        else:
+            candidates = self.normalized.keys()
+
+        results = []
+        for title in sorted(candidates):
+            normalized = self.normalized[title]
+            if normalized.startswith(normalized_target):
+                results.append((title, u'startswiths'))
+            elif normalized.endswith(normalized_target):
+                results.append((title, u'endswiths'))
+            elif normalized.find(normalized_target) != -1:
+                results.append((title, u'contains'))
+        return results
+
+
+def edit_distance(a, b, max_distance):
+    """Optimal string alignment distance of a and b, which counts swapping
+    adjacent characters as one edit. Returns max_distance + 1 if larger.
+
+    Only cells within max_distance of the diagonal are computed.
+    """
+    n, m = len(a), len(b)
+    too_far = max_distance + 1
+    if abs(n - m) > max_distance:
+        return too_far
+
+    prev2 = None
+    prev = [j if j <= max_distance else too_far for j in range(m + 1)]
+    for i in range(1, n + 1):
+        cur = [too_far] * (m + 1)
+        if i <= max_distance:
+            cur[0] = i
+        row_min = cur[0]
+        c = a[i - 1]
+        for j in range(max(1, i - max_distance), min(m, i + max_distance) + 1):
+            d = prev[j - 1] if c == b[j - 1] else prev[j - 1] + 1
+            if prev[j] + 1 < d:
+                d = prev[j] + 1
+            if cur[j - 1] + 1 < d:
+                d = cur[j - 1] + 1
+            if i > 1 and j > 1 and c == b[j - 2] and a[i - 2] == b[j - 1] and prev2[j - 2] + 1 < d:
+                d = prev2[j - 2] + 1
+            cur[j] = d
+            if d < row_min:
+                row_min = d
+        if row_min > max_distance:
+            return too_far
+        prev2, prev = prev, cur
+    return min(prev[m], too_far)
+
+
+def deletes(text, max_distance):
+    """Returns set of strings made by deleting up to max_distance characters"""
+    result = set([text])
+    edge = set([text])
+    for _ in range(max_distance):
+        edge = set(t[:i] + t[i + 1:] for t in edge for i in range(len(t)))
+        result.update(edge)
+    return result
+
+
+class FuzzyIndex(object):
+    """Suggests titles within small edit distance by symmetric deletes.
+
+    Every string made by deleting up to `max_distance` characters from the
+    first `prefix_length` characters of each normalized title is indexed.
+    Strings within the distance share at least one of them, so candidates
+    are found by looking up deletes of the query and then verified by
+    edit_distance(). Queries of up to `short_length` characters are matched
+    within distance 1 only, since nearly every short title is within 2.
+
+    To keep the index small, normalized titles are numbered and each delete
+    maps to a single number, or a list of them if shared.
+    """
+    def __init__(self, titles=(), normalize=None, popularity=None, max_distance=2, prefix_length=6,
+                 short_length=4):
+        self.normalize = normalize or (lambda title: title.lower())
+        self.popularity = popularity or {}
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.short_length = short_length
+        self.titles = {}
+        self.normalized = []
+        self.ids = {}
+        self.deletes = {}
+        for title in titles:
+            self.add(title)
+
+    def add(self, title):
+        normalized = self.normalize(title)
+        if len(normalized) == 0:
+            return
+        titles = self.titles.setdefault(normalized, [])
+        if title not in titles:
+            titles.append(title)
+        if normalized in self.ids:
+            return
+
+        i = len(self.normalized)
+        self.normalized.append(normalized)
+        self.ids[normalized] = i
+        for d in deletes(normalized[:self.prefix_length], self.max_distance):
+            ids = self.deletes.get(d)
+            if ids is None:
+                self.deletes[d] = i
+            elif isinstance(ids, int):
+                self.deletes[d] = [ids, i]
+            else:
+                ids.append(i)
+
+    def remove(self, title):
+        # deletes are left as they are. they are skipped by suggest() until
+        # the title is added again
+        normalized = self.normalize(title)
+        titles = self.titles.get(normalized, [])
+        if title in titles:
+            titles.remove(title)
+        if len(titles) == 0:
+            self.titles.pop(normalized, None)
+
+    def suggest(self, target, limit=10, max_distance=None, titles=None):
+        """Returns up to `limit` titles close to target, closest and most
+        popular first. Titles equal to target are excluded, and so are titles
+        not in `titles` if given."""
+        normalized_target = self.normalize(target)
+        if len(normalized_target) == 0:
+            return []
+        if max_distance is None:
+            max_distance = self.max_distance
+            if len(normalized_target) <= self.short_length:
+                max_distance = min(max_distance, 1)
+
+        candidates = set()
+        for d in deletes(normalized_target[:self.prefix_length], max_distance):
+            ids = self.deletes.get(d)
+            if ids is None:
+                continue
+            elif isinstance(ids, int):
+                candidates.add(ids)
+            else:
+                candidates.update(ids)
+
+        suggestions = []
+        for i in candidates:
+            normalized = self.normalized[i]
+            if normalized not in self.titles:
+                continue
+            distance = edit_distance(normalized_target, normalized, max_distance)
+            if distance == 0 or distance > max_distance:
+                continue
+            for title in self.titles[normalized]:
+                if titles is None or title in titles:
+                    suggestions.append((distance, -self.popularity.get(title, 0), title))
+        return [title for _, _, title in heapq.nsmallest(limit, suggestions)]
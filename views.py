@@ -8,15 +8,13 @@ import jinja2
 import search
 import urllib2
 import webapp2
-import operator
 import logging
 from pyatom import AtomFeed
 from itertools import groupby
-from collections import OrderedDict
 from google.appengine.api import users
 from google.appengine.api import oauth
 from google.appengine.ext import deferred
-from models import WikiPage, WikiPageRevision, UserPreferences, title_grouper, ConflictError
+from models import WikiPage, WikiPageRevision, UserPreferences, DataIndexRebuild, title_grouper, ConflictError
 
 logger = logging.getLogger(__name__)
 
@@ -81,6 +79,7 @@ JINJA.filters['sdt'] = format_short_datetime
 JINJA.filters['isodt'] = format_iso_datetime
 JINJA.filters['to_path'] = to_path
 JINJA.filters['to_pluspath'] = to_pluspath
+JINJA.filters['urlencode'] = urlencode
 JINJA.filters['userpage'] = userpage_link
 JINJA.filters['has_supported_language'] = has_supported_language
 
@@ -98,16 +97,9 @@ class SearchHandler(webapp2.RequestHandler):
         cache.create_prc()
         expression = WikiPage.path_to_title(path)
         parsed_expression = search.parse_expression(expression)
-        scoretable = WikiPage.search(expression)
+        scoretable = WikiPage.search_scores(expression)
 
-        positives = dict([(k, v) for k, v in scoretable.items() if v >= 0.0])
-        positives = OrderedDict(sorted(positives.iteritems(),
-                                       key=operator.itemgetter(1),
-                                       reverse=True)[:20])
-        negatives = dict([(k, abs(v)) for k, v in scoretable.items() if v < 0.0])
-        negatives = OrderedDict(sorted(negatives.iteritems(),
-                                       key=operator.itemgetter(1),
-                                       reverse=True)[:20])
+        positives, negatives = search.split_scores(scoretable, 20)
 
         self.response.headers['Content-Type'] = 'text/html; charset=utf-8'
         html = template(self.request, 'search.html', {'expression': expression,
@@ -125,7 +117,10 @@ class WikiqueryHandler(webapp2.RequestHandler):
         cache.create_prc()
         query = WikiPage.path_to_title(path)
         user = get_cur_user()
-        result = WikiPage.wikiquery(query, user)
+        try:
+            result = WikiPage.wikiquery(query, user)
+        except search.WikiqueryError as e:
+            self.abort(400, unicode(e))
         view = self.request.GET.get('view', 'default')
         restype = get_restype(self.request)
         if restype == 'default' or restype == 'html':
@@ -171,7 +166,20 @@ class PageHandler(webapp2.RequestHandler):
         view = self.request.GET.get('view', 'default')
         page = WikiPage.get_by_title(title)
 
+        # variant spelling of existing page
+        if page.revision == 0 and view != 'edit':
+            canonical_title = WikiPage.get_canonical_title(title)
+            if canonical_title is not None:
+                self.response.headers['Location'] = '/' + WikiPage.title_to_path(canonical_title)
+                if len(self.request.query):
+                    self.response.headers['Location'] += '?%s' % self.request.query
+                self.response.status = 303
+                return
+
         rev = self.request.GET.get('rev', 'latest')
+        if view == 'inlinks':
+            # inlinks are kept for the latest revision only
+            rev = 'latest'
         if rev == 'list':
             self.get_revision_list(restype, page, head)
             return
@@ -190,6 +198,10 @@ class PageHandler(webapp2.RequestHandler):
             set_response_body(self.response, html, False)
             return
 
+        if view == 'inlinks':
+            self.get_inlinks(restype, page, head)
+            return
+
         # custom content-type metadata?
         if restype == 'default' and view == 'default' and page.metadata['content-type'] != 'text/x-markdown':
             self.response.headers['Content-Type'] = '%s; charset=utf-8' % str(page.metadata['content-type'])
@@ -204,6 +216,10 @@ class PageHandler(webapp2.RequestHandler):
                     self.response.status = 303
                     return
 
+                view_count = cache.incr_view_count(page.title)
+                if view_count and view_count % WikiPage.views_per_related_links_churn == 0:
+                    deferred.defer(WikiPage.add_related_links_views, page.title)
+
                 template_data = {
                     'page': page,
                     'message': self.response.headers.get('X-Message', None),
@@ -273,6 +289,31 @@ class PageHandler(webapp2.RequestHandler):
             self.abort(400, 'Unknown type: %s' % restype)
             return
 
+    def get_inlinks(self, restype, page, head):
+        rel = self.request.GET.get('rel', u'%s/relatedTo' % page.itemtype)
+        cursor = self.request.GET.get('cursor', None)
+        titles, next_cursor = page.get_inlinks_page(rel, cursor)
+
+        if restype == 'default':
+            html = template(self.request, 'wikipage.inlinks.html', {
+                'page': page,
+                'rel': rel,
+                'titles': titles,
+                'next_cursor': next_cursor,
+            })
+            self.response.headers['Content-Type'] = 'text/html; charset=utf-8'
+            set_response_body(self.response, html, head)
+        elif restype == 'json':
+            self.response.headers['Content-Type'] = 'application/json; charset=utf-8'
+            set_response_body(self.response, json.dumps({
+                'rel': rel,
+                'titles': titles,
+                'count': len(set(page.inlinks.get(rel, []))),
+                'next_cursor': next_cursor,
+            }), head)
+        else:
+            self.abort(400, 'Unknown type: %s' % restype)
+
     def post(self, path):
         method = self.request.GET.get('_method', 'POST')
         if method == 'DELETE':
@@ -420,19 +461,60 @@ class SpecialPageHandler(webapp2.RequestHandler):
             self.get_posts(user, head)
         elif title == u'search':
             self.get_search(user, head)
+        elif title == u'most linked':
+            self.get_most_linked(user, head)
+        elif title == u'text search':
+            self.get_text_search(user, head)
         elif title == u'opensearch':
             self.get_opensearch(head)
-        elif title == u'randomly update related pages':
-            recent = self.request.GET.get('recent', '0')
-            titles = WikiPage.randomly_update_related_links(50, recent == '1')
+        elif title in [u'update stale related pages', u'randomly update related pages']:
+            titles = WikiPage.update_stale_related_links(50)
             self.response.headers['Content-Type'] = 'text/plain; charset=utf-8'
             self.response.write('\n'.join(titles))
+        elif title == u'update all related pages':
+            deferred.defer(WikiPage.update_all_related_links)
+            self.response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+            self.response.write('Done! (queued)')
         elif title == u'preferences':
             self.get_preferences(user, head)
         elif title == u'rebuild data index':
-            deferred.defer(WikiPage.rebuild_all_data_index, 0)
+            deferred.defer(WikiPage.rebuild_all_data_index)
+            self.response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+            self.response.write('Done! (queued)')
+        elif title == u'data index progress':
+            job = DataIndexRebuild.get_by_id(u'latest')
+            self.response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+            self.response.write(job.report() if job is not None else 'No rebuild has been started.')
+        elif title == u'compact data index':
+            deferred.defer(WikiPage.compact_data_index)
+            self.response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+            self.response.write('Done! (queued)')
+        elif title == u'rebuild text index':
+            deferred.defer(WikiPage.rebuild_text_index)
+            self.response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+            self.response.write('Done! (queued)')
+        elif title == u'build link graph':
+            deferred.defer(WikiPage.build_link_graph)
             self.response.headers['Content-Type'] = 'text/plain; charset=utf-8'
             self.response.write('Done! (queued)')
+        elif title == u'rebuild title filter':
+            WikiPage.rebuild_title_filter()
+            self.response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+            self.response.write('Done!')
+        elif title == u'sweep':
+            self.response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+            if 'cursor' in self.request.GET:
+                # sweep single batch and show what has been fixed
+                cursor = self.request.GET['cursor'] or None
+                report, next_cursor = WikiPage.sweep(cursor)
+                self.response.write('Pages: %d\n' % report['pages'])
+                for key in ['inlinks', 'outlinks', 'placeholders', 'redirects', 'properties']:
+                    for line in report[key]:
+                        self.response.write((u'%s: %s\n' % (key, line)).encode('utf-8'))
+                self.response.write('Next cursor: %s\n' % (next_cursor or ''))
+            else:
+                deferred.defer(WikiPage.sweep_all)
+                self.response.write('Done! (queued)')
         elif title == u'fix suggested pages':
             self.response.headers['Content-Type'] = 'text/plain; charset=utf-8'
             index = int(self.request.GET.get('index', '0'))
@@ -579,11 +661,39 @@ class SpecialPageHandler(webapp2.RequestHandler):
         q = self.request.GET.get('q', None)
 
         if restype == 'json' and resformat == 'opensearch':
-            titles = WikiPage.get_titles(user)
-            if q is not None and len(q) > 0:
-                titles = [t for t in titles if t.find(q) != -1]
+            limit = int(self.request.GET.get('limit', '20'))
+            titles = WikiPage.complete_titles(q or u'', user, limit)
+            self.response.headers['Content-Type'] = 'application/json'
+            set_response_body(self.response, json.dumps([q, titles]), head)
+        else:
+            self.abort(400, 'Unknown type: %s' % restype)
+
+    def get_most_linked(self, user, head):
+        restype = get_restype(self.request)
+
+        if restype == 'json':
+            limit = int(self.request.GET.get('limit', '20'))
+            pages = WikiPage.get_most_linked(limit, user)
             self.response.headers['Content-Type'] = 'application/json'
-            set_response_body(self.response, json.dumps([q, list(titles)]), head)
+            set_response_body(self.response, json.dumps(pages), head)
+        else:
+            self.abort(400, 'Unknown type: %s' % restype)
+
+    def get_text_search(self, user, head):
+        restype = get_restype(self.request)
+        q = self.request.GET.get('q', u'')
+        limit = int(self.request.GET.get('limit', '20'))
+        results = WikiPage.text_search(q, user, limit)
+
+        if restype == 'default':
+            for result in results:
+                result['parts'] = split_highlights(result['snippet'], result['highlights'])
+            html = template(self.request, 'wiki_sp_text_search.html', {'q': q, 'results': results})
+            self.response.headers['Content-Type'] = 'text/html; charset=utf-8'
+            set_response_body(self.response, html, head)
+        elif restype == 'json':
+            self.response.headers['Content-Type'] = 'application/json'
+            set_response_body(self.response, json.dumps(results), head)
         else:
             self.abort(400, 'Unknown type: %s' % restype)
 
@@ -725,3 +835,17 @@ def render_list(o):
     html.append('</ul>')
 
     return '\n'.join(html)
+
+
+def split_highlights(text, highlights):
+    """Returns list of (part, matched) of text split by highlight offsets"""
+    parts = []
+    pos = 0
+    for start, end in highlights:
+        if start > pos:
+            parts.append((text[pos:start], False))
+        parts.append((text[start:end], True))
+        pos = end
+    if pos < len(text):
+        parts.append((text[pos:], False))
+    return parts